@@ -14,34 +14,56 @@ bl_info = {
 }
 
 from typing import List
-import importlib
+import importlib, sys
+from time import perf_counter
+import bpy
 from bpy.utils import register_class, unregister_class
 
-from . import (
-    armature_apply_scale,
-    armature_constraint_vertex_parent,
-    refresh_drivers,
-    create_transform_constraint,
-    setup_action_constraints,
-    vgroup_merge,
-    remove_empty_shapekeys,
-    mark_non_deform_bones,
-    prefs,
-)
-
 # Each module is expected to have a register() and unregister() function.
-modules = [
-    armature_apply_scale,
-    armature_constraint_vertex_parent,
-    refresh_drivers,
-    create_transform_constraint,
-    setup_action_constraints,
-    vgroup_merge,
-    remove_empty_shapekeys,
-    mark_non_deform_bones,
-    prefs,
+module_names = [
+    'prefs',
+    'utils',
+    'armature_apply_scale',
+    'armature_constraint_vertex_parent',
+    'refresh_drivers',
+    'create_transform_constraint',
+    'setup_action_constraints',
+    'vgroup_merge',
+    'remove_empty_shapekeys',
+    'mark_non_deform_bones',
 ]
 
+# Modules that are currently registered.
+modules = []
+
+# Module name : {'import': seconds, 'register': seconds}, displayed in the add-on preferences.
+module_timings = {}
+
+
+def is_developer_mode() -> bool:
+    """Reload modules on registration only when Blender's Developer Extras are enabled,
+    as reloading is only useful while working on the add-on."""
+    return bpy.context.preferences.view.show_developer_ui
+
+
+def import_module(name: str):
+    full_name = f"{__package__}.{name}"
+    start = perf_counter()
+    if full_name in sys.modules and is_developer_mode():
+        m = importlib.reload(sys.modules[full_name])
+    else:
+        m = importlib.import_module(full_name)
+    module_timings.setdefault(name, {})['import'] = perf_counter() - start
+    return m
+
+
+def load_module(name: str):
+    m = import_module(name)
+    start = perf_counter()
+    register_unregister_modules([m], True)
+    module_timings[name]['register'] = perf_counter() - start
+    modules.append(m)
+
 
 def register_unregister_modules(modules: List, register: bool):
     """Recursively register or unregister modules by looking for either
@@ -51,8 +73,6 @@ def register_unregister_modules(modules: List, register: bool):
     register_func = register_class if register else unregister_class
 
     for m in modules:
-        if register:
-            importlib.reload(m)
         if hasattr(m, 'registry'):
             for c in m.registry:
                 try:
@@ -74,8 +94,11 @@ def register_unregister_modules(modules: List, register: bool):
 
 
 def register():
-    register_unregister_modules(modules, True)
+    module_timings.clear()
+    for name in module_names:
+        load_module(name)
 
 
 def unregister():
     register_unregister_modules(modules, False)
+    modules.clear()
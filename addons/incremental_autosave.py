@@ -12,7 +12,9 @@ import bpy
 from bpy.props import BoolProperty, IntProperty, StringProperty
 from bpy.app.handlers import persistent
 from datetime import datetime
-import os, platform, tempfile
+from concurrent.futures import ThreadPoolExecutor
+import gzip, hashlib, json, os, platform, shutil, tempfile, time, zlib
+import numpy as np
 
 # Timestamp format for prefixing autosave file names.
 TIME_FMT_STR = '%Y_%M_%d_%H-%M-%S'
@@ -20,6 +22,44 @@ TIME_FMT_STR = '%Y_%M_%d_%H-%M-%S'
 # Timestamp of when Blender is launched. Used to avoid creating an autosave when opening Blender.
 LAUNCH_TIME = datetime.now()
 
+# Number of depsgraph updates since launch, and its value at the time of the last save.
+# Used to skip saving when nothing was changed since the last save.
+UPDATE_COUNTER = 0
+LAST_SAVED_COUNTER = -1
+
+# Single worker thread that compresses and rotates saved files, so the UI isn't blocked by it.
+# Created on register, and shut down on unregister after finishing any pending work.
+WORKER = None
+
+# Durations of the last save, in seconds, for display in the preferences.
+LAST_SAVE_TIMES = {'save': None, 'compress': None}
+
+# Bytes written by the last save into the deduplicated store, size of the saved file,
+# and total size of the store on disk, for display in the preferences.
+LAST_STORE_STATS = {'written': None, 'size': None, 'store_size': None}
+
+# Name of the folder inside the autosave path that holds the deduplicated store.
+STORE_DIR_NAME = 'incremental_autosave_store'
+
+# Content-defined chunking parameters. A chunk ends after a byte where the hash of the
+# preceding CHUNK_WINDOW bytes has its lowest bits all zero, which happens on average every
+# CHUNK_MASK + 1 bytes. Since the boundaries depend only on nearby content, inserting or
+# removing data only changes the chunks around the edit, and the rest are stored only once.
+CHUNK_WINDOW = 64
+CHUNK_MASK = (1 << 20) - 1
+CHUNK_MIN = 256 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+CHUNK_READ_SIZE = 8 * 1024 * 1024
+
+# A fixed pseudo-random 64-bit value for each byte value. Derived from a hash rather than
+# a random generator, so that chunk boundaries never change between versions.
+CHUNK_BYTE_TABLE = np.frombuffer(
+    b''.join(
+        hashlib.blake2b(bytes([i]), digest_size=8).digest() for i in range(256)
+    ),
+    dtype='<u8',
+)
+
 
 def get_addon_prefs():
     user_preferences = bpy.context.preferences
@@ -100,11 +140,33 @@ class IncrementalAutoSavePreferences(bpy.types.AddonPreferences):
         min=0,
         max=100,
     )
+    storage_mode: bpy.props.EnumProperty(
+        name='Storage',
+        description='How to store the saved copies',
+        items=[
+            (
+                'COPY',
+                'Full Copies',
+                'Save each copy as a separate .blend file',
+            ),
+            (
+                'DEDUPLICATED',
+                'Deduplicated',
+                'Split saved files into chunks and store each distinct chunk only once, so that subsequent saves of a large file only take up the space of what changed. Copies can be restored with File > Recover > Incremental Autosave',
+            ),
+        ],
+        default='COPY',
+    )
     compress_files: bpy.props.BoolProperty(
         name='Compress Files',
         description='Save backups with compression enabled',
         default=True,
     )
+    compress_in_background: bpy.props.BoolProperty(
+        name='Compress in Background',
+        description='Save an uncompressed copy as fast as possible, then compress it and remove old copies on a background thread, to minimize the time the interface is frozen',
+        default=True,
+    )
 
     def draw(self, context):
         layout = self.layout.column()
@@ -157,10 +219,342 @@ class IncrementalAutoSavePreferences(bpy.types.AddonPreferences):
 
         layout.prop(self, 'save_interval')
         layout.prop(self, 'max_save_files')
+        layout.prop(self, 'storage_mode')
         layout.prop(self, 'compress_files')
+        if self.storage_mode == 'COPY':
+            row = layout.row()
+            row.active = self.compress_files
+            row.prop(self, 'compress_in_background')
+
+        save_time = LAST_SAVE_TIMES['save']
+        if save_time is not None:
+            compress_time = LAST_SAVE_TIMES['compress']
+            text = f"Last save froze the interface for {save_time:.2f}s"
+            if compress_time is not None:
+                text += f", background compression took {compress_time:.2f}s"
+            split = layout.split(factor=0.4)
+            split.row()
+            split.label(text=text, icon='TIME')
+
+        if self.storage_mode == 'DEDUPLICATED':
+            if None not in LAST_STORE_STATS.values():
+                split = layout.split(factor=0.4)
+                split.row()
+                split.label(
+                    text="Last save wrote {} of {}, store size is {}".format(
+                        format_size(LAST_STORE_STATS['written']),
+                        format_size(LAST_STORE_STATS['size']),
+                        format_size(LAST_STORE_STATS['store_size']),
+                    ),
+                    icon='DISK_DRIVE',
+                )
+            split = layout.split(factor=0.4)
+            split.row()
+            split.operator(
+                WM_OT_restore_incremental_autosave.bl_idname, icon='RECOVER_LAST'
+            )
+
+
+def format_size(num_bytes):
+    for unit in ('B', 'KB', 'MB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.2f} GB"
+
+
+def get_chunk_ends(buffer, final):
+    """Return the offsets in the buffer where content-defined chunks end.
+    The buffer must start at a chunk boundary. If final is False, the data after the
+    last returned offset may still belong to a chunk that continues in the next buffer."""
+    size = len(buffer)
+    candidates = []
+    if size > CHUNK_WINDOW:
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        # Rolling sum of the byte values over a window, from a cumulative sum.
+        # Integer overflow wraps around, which is fine for a hash.
+        cumsum = np.cumsum(CHUNK_BYTE_TABLE[data], dtype=np.uint64)
+        window_hash = cumsum[CHUNK_WINDOW:] - cumsum[:-CHUNK_WINDOW]
+        candidates = (
+            np.flatnonzero((window_hash & np.uint64(CHUNK_MASK)) == 0) + CHUNK_WINDOW + 1
+        ).tolist()
+
+    ends = []
+    start = 0
+    for end in candidates:
+        while end - start > CHUNK_MAX:
+            start += CHUNK_MAX
+            ends.append(start)
+        if end - start < CHUNK_MIN:
+            continue
+        ends.append(end)
+        start = end
+    while size - start > CHUNK_MAX:
+        start += CHUNK_MAX
+        ends.append(start)
+    if final and start < size:
+        ends.append(size)
+    return ends
+
+
+def iter_file_chunks(filepath):
+    """Yield the content-defined chunks of a file as bytes objects."""
+    with open(filepath, 'rb') as f:
+        buffer = b''
+        while True:
+            block = f.read(CHUNK_READ_SIZE)
+            buffer += block
+            final = not block
+            start = 0
+            for end in get_chunk_ends(buffer, final):
+                yield buffer[start:end]
+                start = end
+            buffer = buffer[start:]
+            if final:
+                return
+
+
+class ChunkStore:
+    """A folder of chunks named by the hash of their content, and a manifest that lists
+    the saved snapshots, the chunks each of them consists of, and the size of each chunk on disk.
+    Only the worker thread writes to the store."""
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    def chunk_path(self, digest):
+        return os.path.join(self.root, 'chunks', digest[:2], digest)
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'snapshots': [], 'chunks': {}}
+
+    def save_manifest(self, manifest):
+        # Write to a temporary file first, so a crash never leaves a broken manifest.
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def add_snapshot(self, filepath, name, basename, compress):
+        """Store a file as a snapshot. Return the number of bytes written."""
+        manifest = self.load_manifest()
+        stored_chunks = manifest['chunks']
+        digests = []
+        size = 0
+        written = 0
+        for chunk in iter_file_chunks(filepath):
+            digest = hashlib.blake2b(chunk, digest_size=20).hexdigest()
+            digests.append(digest)
+            size += len(chunk)
+            if digest in stored_chunks:
+                continue
+            data = zlib.compress(chunk, 1) if compress else chunk
+            chunk_path = self.chunk_path(digest)
+            os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+            with open(chunk_path, 'wb') as f:
+                # First byte marks whether the chunk is compressed.
+                f.write(b'\x01' if compress else b'\x00')
+                f.write(data)
+            stored_chunks[digest] = len(data) + 1
+            written += len(data) + 1
+
+        manifest['snapshots'].append(
+            {
+                'name': name,
+                'basename': basename,
+                'time': time.time(),
+                'size': size,
+                'chunks': digests,
+            }
+        )
+        self.save_manifest(manifest)
+        return written, size
+
+    def remove_old_snapshots(self, basename, max_snapshots):
+        """Remove the oldest snapshots of a file beyond max_snapshots,
+        and delete the chunks that are no longer used by any snapshot."""
+        manifest = self.load_manifest()
+        snapshots = manifest['snapshots']
+        of_file = [snap for snap in snapshots if snap['basename'] == basename]
+        if max_snapshots > 0 and len(of_file) > max_snapshots:
+            removed = {id(snap) for snap in of_file[: len(of_file) - max_snapshots]}
+            snapshots[:] = [snap for snap in snapshots if id(snap) not in removed]
+
+        used = set()
+        for snap in snapshots:
+            used.update(snap['chunks'])
+        unused = [digest for digest in manifest['chunks'] if digest not in used]
+        # Save the manifest before deleting, so it never references missing chunks.
+        for digest in unused:
+            del manifest['chunks'][digest]
+        self.save_manifest(manifest)
+        for digest in unused:
+            try:
+                os.remove(self.chunk_path(digest))
+            except OSError:
+                print("Incremental Autosave: Unable to remove chunk: ", digest)
+        return sum(manifest['chunks'].values())
+
+    def restore_snapshot(self, snapshot, filepath):
+        """Reassemble a snapshot into a .blend file."""
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'wb') as f:
+            for digest in snapshot['chunks']:
+                with open(self.chunk_path(digest), 'rb') as chunk_file:
+                    data = chunk_file.read()
+                f.write(zlib.decompress(data[1:]) if data[:1] == b'\x01' else data[1:])
+        os.replace(temp_path, filepath)
+
+
+def store_snapshot(store_dir, temp_file, name, basename, max_files, compress):
+    """Move a saved .blend file into the deduplicated store, then remove old snapshots.
+    If the file can't be stored, it is kept next to the store as a plain copy instead.
+    Meant to run on the worker thread."""
+    start = time.perf_counter()
+    store = ChunkStore(store_dir)
+    try:
+        written, size = store.add_snapshot(temp_file, name, basename, compress)
+    except OSError as e:
+        print("Incremental Autosave: Error storing file: ", e)
+        fallback_file = os.path.join(os.path.dirname(store_dir), name)
+        try:
+            os.replace(temp_file, fallback_file)
+            print("Incremental Autosave: Kept unstored file: ", fallback_file)
+        except OSError:
+            print("Incremental Autosave: Kept unstored file: ", temp_file)
+        return
+
+    # The snapshot is in the store, so the saved file isn't needed anymore.
+    try:
+        os.remove(temp_file)
+    except OSError:
+        pass
+    try:
+        LAST_STORE_STATS['store_size'] = store.remove_old_snapshots(basename, max_files)
+    except OSError as e:
+        print("Incremental Autosave: Unable to remove old snapshots: ", e)
+    LAST_SAVE_TIMES['compress'] = time.perf_counter() - start
+    LAST_STORE_STATS.update(written=written, size=size)
+    print(
+        f"Incremental Autosave: Stored {name}, wrote {format_size(written)} of {format_size(size)}"
+    )
+
+
+def get_store_dir():
+    return os.path.join(bpy.path.abspath(get_addon_prefs().autosave_path), STORE_DIR_NAME)
+
+
+# Enum items need to be kept referenced from Python, or Blender may display garbage.
+_snapshot_items = []
+
+
+def get_snapshot_items(_self, _context):
+    _snapshot_items.clear()
+    manifest = ChunkStore(get_store_dir()).load_manifest()
+    for snap in reversed(manifest['snapshots']):
+        _snapshot_items.append(
+            (snap['name'], snap['name'], f"{format_size(snap['size'])}")
+        )
+    return _snapshot_items
+
+
+class WM_OT_restore_incremental_autosave(bpy.types.Operator):
+    """Reassemble a copy from the deduplicated autosave store into a .blend file in the autosave folder, and open it"""
+
+    bl_idname = "wm.restore_incremental_autosave"
+    bl_label = "Restore Incremental Autosave"
+    bl_options = {'REGISTER'}
+    bl_property = 'snapshot'
+
+    snapshot: bpy.props.EnumProperty(name='Snapshot', items=get_snapshot_items)
+    open_file: BoolProperty(
+        name='Open File',
+        description='Open the restored file',
+        default=True,
+    )
+
+    def invoke(self, context, _event):
+        context.window_manager.invoke_search_popup(self)
+        return {'RUNNING_MODAL'}
+
+    def execute(self, context):
+        # Wait for any save that's still being stored.
+        WORKER.submit(lambda: None).result()
+
+        store_dir = get_store_dir()
+        store = ChunkStore(store_dir)
+        manifest = store.load_manifest()
+        snapshot = next(
+            (snap for snap in manifest['snapshots'] if snap['name'] == self.snapshot),
+            None,
+        )
+        if not snapshot:
+            self.report({'ERROR'}, "No autosave found in " + store_dir)
+            return {'CANCELLED'}
+
+        # Not ending in the original file name, so rotation of full copies leaves it alone.
+        filename = os.path.splitext(snapshot['name'])[0] + '_restored.blend'
+        filepath = os.path.join(os.path.dirname(store_dir), filename)
+        try:
+            store.restore_snapshot(snapshot, filepath)
+        except (OSError, zlib.error) as e:
+            self.report({'ERROR'}, f"Failed to restore {snapshot['name']}: {e}")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, "Restored autosave to " + filepath)
+        if self.open_file:
+            bpy.ops.wm.open_mainfile(filepath=filepath)
+        return {'FINISHED'}
+
+
+def draw_restore_menu(self, context):
+    self.layout.operator(
+        WM_OT_restore_incremental_autosave.bl_idname, text="Incremental Autosave..."
+    )
+
+
+def remove_old_files(save_dir, basename, max_files):
+    """Delete the oldest autosaves of a file, so that fewer than max_files remain."""
+    # As we prefix saved blends with a timestamp,
+    # `sorted()` puts the oldest prefix at the start of the list.
+    # This should be quicker than getting system timestamps for each file.
+    otherfiles = sorted(
+        [name for name in os.listdir(save_dir) if name.endswith(basename)]
+    )
+    while len(otherfiles) >= max_files:
+        old_file = os.path.join(save_dir, otherfiles[0])
+        os.remove(old_file)
+        otherfiles.pop(0)
+
+
+def compress_and_rotate(backup_file, save_dir, basename, max_files):
+    """Gzip-compress a saved .blend file in place and delete old autosaves.
+    Meant to run on the worker thread. Blender can open gzip-compressed .blend files directly."""
+    start = time.perf_counter()
+    try:
+        temp_file = backup_file + '.tmp'
+        with open(backup_file, 'rb') as f_in, gzip.open(temp_file, 'wb', compresslevel=1) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(temp_file, backup_file)
+    except OSError as e:
+        print("Incremental Autosave: Error compressing file: ", e)
+    LAST_SAVE_TIMES['compress'] = time.perf_counter() - start
+
+    if max_files > 0:
+        try:
+            # Keep the file we just saved.
+            remove_old_files(save_dir, basename, max_files + 1)
+        except OSError:
+            print("Incremental Autosave: Unable to remove old files.")
 
 
 def save_file():
+    global LAST_SAVED_COUNTER
     addon_prefs = get_addon_prefs()
 
     basename = bpy.data.filepath
@@ -177,34 +571,72 @@ def save_file():
         print("Incremental Autosave: Error creating auto save directory.")
         return
 
+    deduplicate = addon_prefs.storage_mode == 'DEDUPLICATED'
+    in_background = deduplicate or (
+        addon_prefs.compress_files and addon_prefs.compress_in_background
+    )
+
     # Delete old files, to limit the number of saves.
-    if addon_prefs.max_save_files > 0:
+    if addon_prefs.max_save_files > 0 and not in_background:
         try:
-            # As we prefix saved blends with a timestamp,
-            # `sorted()` puts the oldest prefix at the start of the list.
-            # This should be quicker than getting system timestamps for each file.
-            otherfiles = sorted(
-                [name for name in os.listdir(save_dir) if name.endswith(basename)]
-            )
-            if len(otherfiles) >= addon_prefs.max_save_files:
-                while len(otherfiles) >= addon_prefs.max_save_files:
-                    old_file = os.path.join(save_dir, otherfiles[0])
-                    os.remove(old_file)
-                    otherfiles.pop(0)
+            remove_old_files(save_dir, basename, addon_prefs.max_save_files)
         except:
             print("Incremental Autosave: Unable to remove old files.")
 
     # Save the copy.
-    time = datetime.now()
-    filename = time.strftime(TIME_FMT_STR) + '_' + basename
+    time_stamp = datetime.now()
+    filename = time_stamp.strftime(TIME_FMT_STR) + '_' + basename
     backup_file = os.path.join(save_dir, filename)
+    if deduplicate:
+        # Uncompressed data deduplicates well, the chunks are compressed individually.
+        store_dir = os.path.join(save_dir, STORE_DIR_NAME)
+        os.makedirs(store_dir, exist_ok=True)
+        backup_file = os.path.join(store_dir, 'pending_' + filename)
+    start = time.perf_counter()
     try:
         bpy.ops.wm.save_as_mainfile(
-            filepath=backup_file, copy=True, compress=addon_prefs.compress_files
+            filepath=backup_file,
+            copy=True,
+            compress=addon_prefs.compress_files and not in_background,
         )
         print("Incremental Autosave: Saved file: ", backup_file)
     except:
         print('Incremental Autosave: Error auto saving file.')
+        return
+    LAST_SAVE_TIMES['save'] = time.perf_counter() - start
+    LAST_SAVE_TIMES['compress'] = None
+    LAST_SAVED_COUNTER = UPDATE_COUNTER
+
+    if deduplicate:
+        WORKER.submit(
+            store_snapshot,
+            store_dir,
+            backup_file,
+            filename,
+            basename,
+            addon_prefs.max_save_files,
+            addon_prefs.compress_files,
+        )
+    elif in_background:
+        WORKER.submit(
+            compress_and_rotate,
+            backup_file,
+            save_dir,
+            basename,
+            addon_prefs.max_save_files,
+        )
+
+
+@persistent
+def count_updates(_scene=None, _depsgraph=None):
+    global UPDATE_COUNTER
+    UPDATE_COUNTER += 1
+
+
+def has_changes_since_last_save():
+    # is_dirty means there are changes that haven't been saved to disk.
+    # The update counter catches files that stay dirty after an autosave, since autosaves are copies.
+    return bpy.data.is_dirty and UPDATE_COUNTER != LAST_SAVED_COUNTER
 
 
 @persistent
@@ -220,7 +652,7 @@ def create_autosave():
     if delta.seconds < 5:
         return get_addon_prefs().save_interval * 60
 
-    if bpy.data.is_dirty:
+    if has_changes_since_last_save():
         save_file()
     return get_addon_prefs().save_interval * 60
 
@@ -231,14 +663,26 @@ def register_autosave_timer(_dummy=None):
 
 
 def register():
+    global WORKER
+    WORKER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="IncrementalAutosave")
     bpy.utils.register_class(IncrementalAutoSavePreferences)
+    bpy.utils.register_class(WM_OT_restore_incremental_autosave)
+    bpy.types.TOPBAR_MT_file_recover.append(draw_restore_menu)
     bpy.app.timers.register(create_autosave)
     bpy.app.handlers.load_pre.append(save_pre_close)
     bpy.app.handlers.load_post.append(register_autosave_timer)
+    bpy.app.handlers.depsgraph_update_post.append(count_updates)
 
 
 def unregister():
     bpy.app.handlers.load_pre.remove(save_pre_close)
     bpy.app.handlers.load_post.remove(register_autosave_timer)
+    bpy.app.handlers.depsgraph_update_post.remove(count_updates)
     bpy.app.timers.unregister(create_autosave)
+    bpy.types.TOPBAR_MT_file_recover.remove(draw_restore_menu)
+    bpy.utils.unregister_class(WM_OT_restore_incremental_autosave)
     bpy.utils.unregister_class(IncrementalAutoSavePreferences)
+    global WORKER
+    # Let a pending compression or store finish, so no save is lost or left half written.
+    WORKER.shutdown(wait=True)
+    WORKER = None
@@ -1,16 +1,18 @@
 import bpy
+import ast
 from bpy.props import *
+from . import utils
 
 # In order to apply (UNIFORM) scale on an armature without breaking the rigging, 
 # we need to apply the scale factor to all location values used by the rig.
 # This includes:
 # - Every property of every constraint that is a location/distance/length value.
 # - Every location curve used by Actions used by the armature's Action constraints.
-# - Every driver expression that references a variable that is a location. NOTE: Not implemented.
+# - Every driver expression that references a variable that is a location.
 # - Every custom shape transform location offset value.
 
 class ApplyArmatureScale(bpy.types.Operator):
-	""" Apply uniform scaling to an armature while adjusting constraints and used Actions so the armature behaves identically on the new scale. Does not adjust drivers that might affect or read locations, nor apply scale of child objects"""
+	""" Apply uniform scaling to selected armatures while adjusting constraints and used Actions so the armature behaves identically on the new scale. Does not apply scale of child objects"""
 	bl_idname = "object.apply_armature_scale"
 	bl_label = "Apply Armature Scale"
 	bl_options = {'REGISTER', 'UNDO'}
@@ -30,83 +32,300 @@ class ApplyArmatureScale(bpy.types.Operator):
 		,description = "Adjust location curves of ALL Actions in the scene, regardless of whether the action is used by the armature or not"
 		,default	 = False
 	)
-	# do_drivers: BoolProperty(
-	# 	name		 = "Adjust Driver Expressions"
-	# 	,description = "Try to adjust driver expressions that read or write location"
-	# )	# TODO, this seems tricky and I don't need it right now.
+	do_drivers: BoolProperty(
+		name		 = "Adjust Driver Expressions"
+		,description = "Try to adjust driver expressions that read or write bone locations of the scaled armatures. Drivers that can't be safely adjusted are listed in the console"
+		,default	 = False
+	)
 
 	def execute(self, context):
-		o = context.object
-		if (o.scale[0] != o.scale[1]) or (o.scale[0] != o.scale[2]):
-			# Scale must be uniform!
-			return {['CANCELLED']}
-
-		org_mode = o.mode
-		bpy.ops.object.mode_set(mode='OBJECT')
-
-		scale = o.scale[0]
-		props = []
-		actions = []
-
-		for b in o.pose.bones:
-			# Adjust bone properties
-			if not b.use_custom_shape_bone_size:
-				b.custom_shape_scale_xyz *= scale
-				if self.do_round:
-					b.custom_shape_scale_xyz = [round(b.custom_shape_scale_xyz[i], 2) for i in range(3)]
-
-			# Adjust custom shape offsets
-			b.custom_shape_translation *= scale
-
-			# Adjust constraints
-			for c in b.constraints:
-				if c.type in ['LIMIT_LOCATION', 'LIMIT_SCALE']:
-					props = ['min_x', 'max_x',
-							'min_y', 'max_y',
-							'min_z', 'max_z',
-					]
-				elif c.type=='LIMIT_DISTANCE':
-					props = ['distance']
-				elif c.type=='TRANSFORM':
-					props = [
-						"from_min_x", "from_max_x", "to_min_x", "to_max_x",
-						"from_min_y", "from_max_y", "to_min_y", "to_max_y",
-						"from_min_z", "from_min_z", "to_min_z", "to_max_z"
-					]
-				elif c.type=='STRETCH_TO':
-					props = ["rest_length"]
-				elif c.type=='ACTION':
-					if c.action not in actions:
-						actions.append(c.action)
-					props = ["min", "max"]
-				elif c.type=='FLOOR':
-					props = ["offset"]
-				else:
-					continue
-				
-				for prop in props:
-					new_value = getattr(c, prop) * scale
-					setattr(c, prop, new_value)
-		
+		rigs = [o for o in context.selected_objects if o.type == 'ARMATURE']
+		if context.object and context.object.type == 'ARMATURE' and context.object not in rigs:
+			rigs.append(context.object)
+		if not rigs:
+			self.report({'ERROR'}, "No armatures selected.")
+			return {'CANCELLED'}
+
+		for rig in rigs:
+			if (rig.scale[0] != rig.scale[1]) or (rig.scale[0] != rig.scale[2]):
+				self.report({'ERROR'}, f'Scale of "{rig.name}" must be uniform.')
+				return {'CANCELLED'}
+
+		org_mode = context.object.mode if context.object else 'OBJECT'
+		if org_mode != 'OBJECT':
+			bpy.ops.object.mode_set(mode='OBJECT')
+
+		if self.do_drivers:
+			num_drivers, failures = scale_drivers({rig: rig.scale[0] for rig in rigs})
+			for failure in failures:
+				print("Apply Armature Scale: Could not adjust driver: ", failure)
+			if failures:
+				self.report({'WARNING'}, f"Adjusted {num_drivers} drivers, {len(failures)} could not be adjusted. See console for details.")
+			else:
+				self.report({'INFO'}, f"Adjusted {num_drivers} drivers.")
+
+		action_scales = {}
+		for rig in rigs:
+			scale = rig.scale[0]
+			for action in scale_rig(rig, scale, do_round=self.do_round):
+				action_scales.setdefault(action, set()).add(scale)
+
 		# Adjust Actions
 		if self.do_actions:
 			if self.all_actions:
-				actions = bpy.data.actions
-			for action in actions:
-				for cur in action.fcurves:
-					if "location" in cur.data_path:
-						for kf in cur.keyframe_points:
-							kf.co[1] *= scale
-							kf.handle_left[1] *= scale
-							kf.handle_right[1] *= scale
+				scales = {rig.scale[0] for rig in rigs}
+				action_scales = {action: scales for action in bpy.data.actions}
+			by_scale = {}
+			for action, scales in action_scales.items():
+				if len(scales) > 1:
+					self.report({'WARNING'}, f'Action "{action.name}" is used by rigs with different scales, skipping.')
+					continue
+				by_scale.setdefault(next(iter(scales)), []).append(action)
+			num_curves = num_keys = 0
+			for scale, actions in by_scale.items():
+				curves, keys = scale_action_locations(actions, scale)
+				num_curves += curves
+				num_keys += keys
+			self.report({'INFO'}, f"Scaled {num_keys} keyframes on {num_curves} location curves.")
 
 
+		# transform_apply only affects selected objects, and the active rig may not be selected.
+		for rig in rigs:
+			rig.select_set(True)
 		bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
 
-		bpy.ops.object.mode_set(mode=org_mode)
+		if org_mode != 'OBJECT':
+			bpy.ops.object.mode_set(mode=org_mode)
 		
 		return {'FINISHED'}
 
+# Length values that RNA doesn't mark with a LENGTH unit, because their meaning depends on other constraint settings.
+EXTRA_LENGTH_PROPS = {
+	'ACTION': lambda con: ["min", "max"] if con.transform_channel.startswith('LOCATION') else [],
+}
+
+# Constraint type : list of (property name, array length) of its length-valued properties.
+_length_props_cache = {}
+
+def get_length_props(con):
+	"""Return the (name, array length) of each writable length-valued property of a constraint.
+	Derived from RNA unit metadata once per constraint type, then cached."""
+	props = _length_props_cache.get(con.type)
+	if props is None:
+		props = [
+			(p.identifier, p.array_length) for p in con.bl_rna.properties
+			if p.type == 'FLOAT' and p.unit == 'LENGTH' and not p.is_readonly
+		]
+		_length_props_cache[con.type] = props
+	extra = EXTRA_LENGTH_PROPS.get(con.type)
+	if extra:
+		return props + [(name, 0) for name in extra(con)]
+	return props
+
+def scale_constraint(con, scale):
+	for prop, array_length in get_length_props(con):
+		value = getattr(con, prop)
+		if array_length:
+			setattr(con, prop, [v * scale for v in value])
+		else:
+			setattr(con, prop, value * scale)
+
+def scale_rig(rig, scale, do_round=True):
+	"""Scale the bone shape sizes and constraint length values of an armature.
+	Return the set of Actions used by its Action constraints."""
+	actions = set()
+	for b in rig.pose.bones:
+		# Adjust bone properties
+		if not b.use_custom_shape_bone_size:
+			b.custom_shape_scale_xyz *= scale
+			if do_round:
+				b.custom_shape_scale_xyz = [round(b.custom_shape_scale_xyz[i], 2) for i in range(3)]
+
+		# Adjust custom shape offsets
+		b.custom_shape_translation *= scale
+
+		# Adjust constraints
+		for c in b.constraints:
+			if c.type == 'ACTION' and c.action:
+				actions.add(c.action)
+			scale_constraint(c, scale)
+	return actions
+
+def get_action_fcurves(action):
+	"""Yield all F-Curves of an Action, from the channelbags of all its slots for layered Actions (Blender 4.4+),
+	or from action.fcurves for legacy Actions."""
+	if getattr(action, 'is_action_layered', False):
+		for layer in action.layers:
+			for strip in layer.strips:
+				for channelbag in strip.channelbags:
+					yield from channelbag.fcurves
+	elif hasattr(action, 'fcurves'):
+		yield from action.fcurves
+
+def scale_fcurve_values(fcurve, scale):
+	"""Multiply the values of all keyframes and their handles of an F-Curve in one vectorized pass."""
+	import numpy as np
+	keyframes = fcurve.keyframe_points
+	num_keys = len(keyframes)
+	if num_keys == 0:
+		return 0
+	co = np.empty(num_keys * 2, dtype=np.float32)
+	for prop in ('co', 'handle_left', 'handle_right'):
+		keyframes.foreach_get(prop, co)
+		co[1::2] *= scale
+		keyframes.foreach_set(prop, co)
+	fcurve.update()
+	return num_keys
+
+def scale_action_locations(actions, scale):
+	"""Scale the location curves of the given Actions. Return the number of curves and keyframes affected."""
+	num_curves = num_keys = 0
+	for action in set(actions):
+		if not action:
+			continue
+		for fcurve in get_action_fcurves(action):
+			if "location" in fcurve.data_path:
+				num_keys += scale_fcurve_values(fcurve, scale)
+				num_curves += 1
+	return num_curves, num_keys
+
+# Expression text : list of (start, end, name) of the names it reads, or None if it can't be parsed.
+_expression_cache = {}
+
+def parse_expression_names(expression):
+	"""Return the byte offsets and identifiers of every name read by a driver expression,
+	or None if the expression can't be parsed. Cached by expression text, since rigs tend
+	to repeat the same few expressions across many drivers."""
+	if expression in _expression_cache:
+		return _expression_cache[expression]
+	names = None
+	try:
+		tree = ast.parse(expression, mode='eval')
+		names = [
+			(node.col_offset, node.end_col_offset, node.id) for node in ast.walk(tree)
+			if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+		]
+		if any(node.lineno != 1 or node.end_lineno != 1 for node in ast.walk(tree) if isinstance(node, ast.Name)):
+			names = None
+	except (SyntaxError, ValueError):
+		pass
+	_expression_cache[expression] = names
+	return names
+
+def rescale_expression(expression, var_scales):
+	"""Return the expression with each variable in var_scales replaced by (variable / scale),
+	or None if the expression can't be parsed."""
+	names = parse_expression_names(expression)
+	if names is None:
+		return None
+	# ast offsets are in UTF-8 bytes.
+	expr_bytes = expression.encode()
+	for start, end, name in sorted(names, reverse=True):
+		if name in var_scales:
+			expr_bytes = expr_bytes[:start] + f"({name} / {var_scales[name]!r})".encode() + expr_bytes[end:]
+	return expr_bytes.decode()
+
+def get_target_scale(target, rig_scales):
+	"""Return the scale that a driver variable target's location value changes by, or 1.0 if it doesn't."""
+	rig = target.id
+	if rig in rig_scales:
+		# Bone locations in world space don't change when the armature's scale is applied,
+		# and neither does the location of the armature object itself.
+		if target.bone_target and target.transform_space != 'WORLD_SPACE':
+			return rig_scales[rig]
+	return 1.0
+
+def get_variable_scale(var, rig_scales):
+	"""Return the scale that a driver variable's value changes by, 1.0 if it doesn't, or None if that can't be determined."""
+	if var.type == 'TRANSFORMS':
+		target = var.targets[0]
+		if target.transform_type.startswith('LOC_'):
+			return get_target_scale(target, rig_scales)
+	elif var.type == 'LOC_DIFF':
+		scales = {get_target_scale(target, rig_scales) for target in var.targets}
+		if len(scales) > 1:
+			return None
+		return scales.pop()
+	elif var.type == 'SINGLE_PROP':
+		target = var.targets[0]
+		path = target.data_path
+		if target.id in rig_scales and 'bones[' in path and 'location' in path:
+			return rig_scales[target.id]
+		rig_datas = {rig.data: scale for rig, scale in rig_scales.items()}
+		if target.id in rig_datas and any(word in path for word in ('head', 'tail', 'length')):
+			return rig_datas[target.id]
+	return 1.0
+
+def is_identity_fcurve(fcurve):
+	"""Whether a driver F-Curve passes the driver's value through unchanged."""
+	if len(fcurve.keyframe_points) > 0:
+		return False
+	for mod in fcurve.modifiers:
+		if mod.type != 'GENERATOR' or mod.mute:
+			continue
+		if mod.mode != 'POLYNOMIAL' or mod.use_additive or list(mod.coefficients)[:2] != [0.0, 1.0]:
+			return False
+		if mod.poly_order != 1:
+			return False
+	return True
+
+def scale_driver(id, fcurve, rig_scales):
+	"""Adjust a single driver for the new scale of the armatures in rig_scales.
+	Return True if the driver was changed, False if it didn't need changing.
+	Raise ValueError with the reason if it can't be safely adjusted."""
+	driver = fcurve.driver
+	var_scales = {}
+	for var in driver.variables:
+		var_scale = get_variable_scale(var, rig_scales)
+		if var_scale is None:
+			raise ValueError(f'variable "{var.name}" compares locations in different spaces')
+		if var_scale != 1.0:
+			var_scales[var.name] = var_scale
+
+	# Drivers that write a bone location of a scaled armature need their result scaled too.
+	out_scale = 1.0
+	if id in rig_scales and 'bones[' in fcurve.data_path and 'location' in fcurve.data_path:
+		out_scale = rig_scales[id]
+
+	if not var_scales and out_scale == 1.0:
+		return False
+
+	if var_scales and driver.type != 'SCRIPTED':
+		raise ValueError(f"{driver.type} drivers reading scaled locations can't be rewritten")
+
+	expression = driver.expression
+	if var_scales:
+		expression = rescale_expression(expression, var_scales)
+		if expression is None:
+			raise ValueError(f'expression "{driver.expression}" could not be parsed')
+
+	if out_scale != 1.0:
+		if len(fcurve.keyframe_points) > 0 and not fcurve.modifiers:
+			scale_fcurve_values(fcurve, out_scale)
+		elif driver.type == 'SCRIPTED' and is_identity_fcurve(fcurve):
+			expression = f"({expression}) * {out_scale!r}"
+		else:
+			raise ValueError("the driver's output is shaped by its F-Curve and can't be scaled")
+
+	if driver.type == 'SCRIPTED':
+		driver.expression = expression
+	return True
+
+def scale_drivers(rig_scales):
+	"""Adjust every driver in the file that reads or writes bone locations of the given armatures.
+	rig_scales: Dictionary of armature object : its scale, before it is applied.
+	Return the number of adjusted drivers, and a list of descriptions of drivers that couldn't be adjusted."""
+	num_drivers = 0
+	failures = []
+	for id in utils.get_animated_datablocks():
+		for fcurve in id.animation_data.drivers:
+			try:
+				if scale_driver(id, fcurve, rig_scales):
+					num_drivers += 1
+			except ValueError as e:
+				failures.append(f"{id.name}: {fcurve.data_path}[{fcurve.array_index}]: {e}")
+	return num_drivers, failures
+
 def register():
 	from bpy.utils import register_class
 	register_class(ApplyArmatureScale)
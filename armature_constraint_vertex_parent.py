@@ -1,4 +1,5 @@
 import bpy
+from bpy.props import BoolProperty
 
 class MESH_OT_vertex_parent_bone(bpy.types.Operator):
 	"""Parent selected pose bones to selected vertices using an Armature modifier"""
@@ -7,6 +8,12 @@ class MESH_OT_vertex_parent_bone(bpy.types.Operator):
 	bl_label = "Parent Pose Bones to Vertices"
 	bl_options = {'REGISTER', 'UNDO'}
 
+	use_clusters: BoolProperty(
+		name		 = "Nearest Vertices Only"
+		,description = "When multiple bones are selected, parent each bone only to the selected vertices that are closer to it than to any other selected bone"
+		,default	 = True
+	)
+
 	@classmethod
 	def poll(cls, context):
 		"""This operator is available when there is a selected armature and the user is in mesh edit mode."""
@@ -17,47 +24,82 @@ class MESH_OT_vertex_parent_bone(bpy.types.Operator):
 						return True
 
 	def execute(self, context):
+		import numpy as np
 		for o in context.selected_objects:
 			if o.type=='ARMATURE':
 				rig = o
 
-		selected_pose_bones = []
-		deforming_pose_bones = []
-		for pb in rig.pose.bones:
-			if pb.bone.select:
-				selected_pose_bones.append(pb)
-			if pb.bone.use_deform:
-				deforming_pose_bones.append(pb)
+		selected_pose_bones = [pb for pb in rig.pose.bones if pb.bone.select]
+		if not selected_pose_bones:
+			self.report({'ERROR'}, "No pose bones selected.")
+			return {'CANCELLED'}
 
 		meshob = context.object
+		# Make sure the mesh data reflects the edit mode selection.
+		meshob.update_from_editmode()
 		mesh = meshob.data
 
-		selected_verts = list(filter(lambda v: v.select, mesh.vertices))
-
-		weights = {}	# pose bone name : total un-normalized weight
-		for v in selected_verts:
-			for pb in deforming_pose_bones:
-				vg = meshob.vertex_groups.get(pb.name)
-				if not vg: continue
-
-				try:
-					w = vg.weight(v.index)
-					if vg.name not in weights:
-						weights[vg.name] = 0
-					weights[vg.name] += w
-				except:
-					pass
-
-		# Normalize the weights
-		sum_weights = sum(weights.values())
-		weights = {bonename:v/sum_weights for (bonename, v) in weights.items()}
-		for pb in selected_pose_bones:
+		# Vertex group index : bone name, for groups of deforming bones.
+		deform_groups = {}
+		for pb in rig.pose.bones:
+			if not pb.bone.use_deform:
+				continue
+			vg = meshob.vertex_groups.get(pb.name)
+			if vg:
+				deform_groups[vg.index] = pb.name
+
+		selection = np.zeros(len(mesh.vertices), dtype=bool)
+		mesh.vertices.foreach_get('select', selection)
+		selected_indices = np.flatnonzero(selection)
+		if selected_indices.size == 0:
+			self.report({'ERROR'}, "No vertices selected.")
+			return {'CANCELLED'}
+
+		# Assign each selected vertex to the cluster of the bone whose head is nearest to it.
+		clusters = np.zeros(len(selected_indices), dtype=np.int64)
+		if self.use_clusters and len(selected_pose_bones) > 1:
+			co = np.zeros(len(mesh.vertices) * 3, dtype=np.float32)
+			mesh.vertices.foreach_get('co', co)
+			co = co.reshape(-1, 3)[selected_indices]
+			mat = np.array(meshob.matrix_world, dtype=np.float32)
+			co = co @ mat[:3, :3].T + mat[:3, 3]
+			heads = np.array([rig.matrix_world @ pb.head for pb in selected_pose_bones], dtype=np.float32)
+			distances = ((co[:, None, :] - heads[None, :, :]) ** 2).sum(axis=2)
+			clusters = distances.argmin(axis=1)
+
+		# Accumulate un-normalized weight per (cluster, vertex group).
+		group_ids = []
+		cluster_ids = []
+		group_weights = []
+		for cluster, v_index in zip(clusters.tolist(), selected_indices.tolist()):
+			for g in mesh.vertices[v_index].groups:
+				if g.group in deform_groups:
+					group_ids.append(g.group)
+					cluster_ids.append(cluster)
+					group_weights.append(g.weight)
+		num_groups = len(meshob.vertex_groups)
+		totals = np.zeros((len(selected_pose_bones), num_groups), dtype=np.float64)
+		np.add.at(totals, (np.array(cluster_ids, dtype=np.int64), np.array(group_ids, dtype=np.int64)), group_weights)
+
+		if not self.use_clusters or len(selected_pose_bones) == 1:
+			totals[:] = totals[0]
+
+		skipped = []
+		for pb, bone_totals in zip(selected_pose_bones, totals):
+			sum_weights = bone_totals.sum()
+			if sum_weights <= 0.0:
+				skipped.append(pb.name)
+				continue
+			# Normalize the weights
 			arm_con = pb.constraints.new('ARMATURE')
-			for bonename in weights.keys():
+			for group_index in np.flatnonzero(bone_totals).tolist():
 				t = arm_con.targets.new()
 				t.target = rig
-				t.subtarget = bonename
-				t.weight = weights[bonename]
+				t.subtarget = deform_groups[group_index]
+				t.weight = bone_totals[group_index] / sum_weights
+
+		if skipped:
+			self.report({'WARNING'}, "No deforming weights found near: " + ", ".join(skipped))
 
 		return {'FINISHED'}
 
@@ -2,7 +2,17 @@ import bpy
 import os
 from bpy.types import PropertyGroup
 from bpy.props import PointerProperty
-from .operators import TransferShapeKeyDrivers, TransferMeshData, MapTopology
+from .operators import (
+    TransferShapeKeyDrivers,
+    TransferMeshData,
+    MeshDataTransferCache,
+    MapTopology,
+)
+from .mesh_data_transfer import (
+    invalidate_source_cache,
+    clear_source_cache,
+    clear_source_cache_on_load,
+)
 
 bl_info = {
     "name": "MeshDataTransfer",
@@ -137,6 +147,37 @@ class MeshDataSettings(PropertyGroup):
         name="Snap shape key to closest vertex",
         description="Snap transferred shape keys vertices to closest vertex on source shape key",
     )
+    snap_shapekey_to_basis_verts: bpy.props.BoolProperty(
+        name="Snap to Basis Vertices",
+        description="When snapping shape keys, follow the source vertex that is closest in the basis shape in every shape key, instead of searching the closest vertex again in each shape key. Faster with many shape keys, but vertices can't switch to a different source vertex",
+    )
+
+    normalize_vertex_groups: bpy.props.BoolProperty(
+        name="Normalize",
+        description="Normalize the transferred vertex groups of deforming bones, so that together with the target's other deform groups, which are left as they are, the weights of each vertex add up to 1. Without an armature, all vertex groups count as deforming",
+    )
+    prune_vertex_groups_threshold: bpy.props.FloatProperty(
+        name="Prune Threshold",
+        description="Remove transferred weights below this value",
+        default=0.0,
+        min=0.0,
+        max=1.0,
+    )
+    vertex_groups_half_precision: bpy.props.BoolProperty(
+        name="Half Precision",
+        description="Store source weights with half precision while transferring, to save memory with many vertex groups",
+    )
+    vertex_groups_chunk_size: bpy.props.IntProperty(
+        name="Groups per Chunk",
+        description="Number of vertex groups to transfer at once, to limit memory use with many vertex groups. 0 means all at once",
+        default=32,
+        min=0,
+    )
+
+    use_correspondence_cache: bpy.props.BoolProperty(
+        name="Cache Correspondence",
+        description="Save which source triangle each target vertex projects onto in a folder next to the .blend file, and reuse it while both meshes and the search settings stay the same. Files are never deleted automatically: every edit of either mesh leaves the previous file behind, so purge the cache from time to time",
+    )
 
     more_settings: bpy.props.BoolProperty(default=False)
 
@@ -295,6 +336,13 @@ class DATA_PT_mesh_data_transfer(bpy.types.Panel):
         right_bottom_row_box_layout.prop(
             ob_prop, "exclude_locked_groups", text="", toggle=True, icon='LOCKED'
         )
+        right_bottom_row_box_layout.prop(
+            ob_prop,
+            "normalize_vertex_groups",
+            text="",
+            toggle=True,
+            icon='NORMALIZE_FCURVES',
+        )
 
         # mesh picker layout
         mesh_picker_box_layout = main_box_layout.box()
@@ -339,6 +387,11 @@ class DATA_PT_mesh_data_transfer(bpy.types.Panel):
             text="Transfer Mesh Data",
             icon="MOD_DATA_TRANSFER",
         )
+        transfer_layout.operator(
+            "object.transfer_mesh_data",
+            text="To Selected",
+            icon="SELECT_EXTEND",
+        ).selected_targets = True
 
         # # transfer_layout.prop(ob_prop, "transfer_edit_selection", text="", toggle =True, icon = restrict_icon)
         # transfer_layout.operator("object.map_topology", text="Map Topology",
@@ -374,6 +427,18 @@ class DATA_PT_mesh_data_transfer(bpy.types.Panel):
                 text="Transfer Shape Keys drivers",
                 icon="DRIVER",
             )
+            shape_keys_box_layout = utility_box_layout.box()
+            shape_keys_box_layout.prop(ob_prop, "snap_shapekey_to_basis_verts")
+            vertex_groups_box_layout = utility_box_layout.box()
+            vertex_groups_box_layout.prop(ob_prop, "prune_vertex_groups_threshold")
+            vertex_groups_row = vertex_groups_box_layout.row(align=True)
+            vertex_groups_row.prop(ob_prop, "vertex_groups_chunk_size")
+            vertex_groups_row.prop(ob_prop, "vertex_groups_half_precision", toggle=True)
+
+            cache_box_layout = utility_box_layout.box()
+            cache_box_layout.prop(ob_prop, "use_correspondence_cache")
+            cache_row = cache_box_layout.row(align=True)
+            cache_row.operator_enum("object.mesh_data_transfer_cache", "action")
 
 
 # =================================================================================================================
@@ -383,6 +448,7 @@ registry = (
     MeshDataSettings,
     TransferShapeKeyDrivers,
     TransferMeshData,
+    MeshDataTransferCache,
     MapTopology,
 )
 
@@ -392,6 +458,8 @@ def register():
         bpy.utils.register_class(cl)
 
     bpy.types.Object.mesh_data_transfer_object = PointerProperty(type=MeshDataSettings)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_source_cache)
+    bpy.app.handlers.load_pre.append(clear_source_cache_on_load)
 
 
 def unregister():
@@ -399,3 +467,6 @@ def unregister():
         bpy.utils.unregister_class(cl)
 
     del bpy.types.Object.mesh_data_transfer_object
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_source_cache)
+    bpy.app.handlers.load_pre.remove(clear_source_cache_on_load)
+    clear_source_cache()
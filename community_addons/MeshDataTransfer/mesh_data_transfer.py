@@ -1,12 +1,319 @@
 import bmesh
 import bpy
+from bpy.app.handlers import persistent
 from mathutils import Vector
 import numpy as np
 import codecs
+import hashlib
+import os
+from collections import OrderedDict
 from mathutils.bvhtree import BVHTree
 from mathutils import Vector, kdtree
 
 
+# Triangulated source meshes and their BVHTrees from recent transfers, so that transferring
+# from the same source to many targets only builds them once.
+# (object, mesh, deformed, world_space, uv_space, triangulate, geometry hash) : SourceGeometry
+_source_cache = OrderedDict()
+
+# Least recently used source geometry is freed when the cache grows beyond this many bytes.
+SOURCE_CACHE_BUDGET = 1024 * 1024 * 1024
+
+# Rough memory use of BMesh elements and BVHTree nodes, to estimate the size of a cache entry.
+BMESH_BYTES_PER_ELEMENT = 128
+BVH_BYTES_PER_FACE = 64
+
+# Number of vertices projected between numpy gathers and scatters in cast_verts().
+PROJECTION_CHUNK_SIZE = 65536
+
+# Bump when the stored correspondence arrays change meaning, to ignore old cache files.
+CORRESPONDENCE_CACHE_VERSION = 1
+
+
+class SourceGeometry:
+    """
+    A triangulated bmesh, its BVHTree and vertex map, shared between transfers through the cache.
+    """
+
+    def __init__(self, transfer_bmesh, bvhtree, vertex_map):
+        self.transfer_bmesh = transfer_bmesh
+        self.bvhtree = bvhtree
+        self.vertex_map = vertex_map
+        # Filled by MeshData.get_triangle_arrays() on first use.
+        self.triangle_arrays = None
+        # Number of MeshData currently using this geometry. It is only freed while unused.
+        self.users = 0
+        # Set when the source was edited or moved, so this is freed once it is unused.
+        self.stale = False
+        element_count = (
+            len(transfer_bmesh.verts)
+            + len(transfer_bmesh.edges)
+            + len(transfer_bmesh.faces) * 4
+        )
+        self.size = (
+            element_count * BMESH_BYTES_PER_ELEMENT
+            + len(transfer_bmesh.faces) * BVH_BYTES_PER_FACE
+        )
+
+    def free(self):
+        self.transfer_bmesh.free()
+        self.bvhtree = None
+
+
+def free_stale_source_geometry():
+    for key, geometry in list(_source_cache.items()):
+        if geometry.stale and not geometry.users:
+            _source_cache.pop(key).free()
+
+
+def get_cached_source_geometry(key):
+    free_stale_source_geometry()
+    geometry = _source_cache.get(key)
+    if geometry:
+        _source_cache.move_to_end(key)
+    return geometry
+
+
+def add_cached_source_geometry(key, geometry):
+    free_stale_source_geometry()
+    # A stale entry with the same key that is still in use is left to the garbage collector.
+    replaced = _source_cache.pop(key, None)
+    if replaced and not replaced.users:
+        replaced.free()
+    _source_cache[key] = geometry
+    total_size = sum(cached.size for cached in _source_cache.values())
+    # Evict the least recently used entries that aren't in use, but always keep the new one.
+    for old_key, cached in list(_source_cache.items())[:-1]:
+        if total_size <= SOURCE_CACHE_BUDGET:
+            break
+        if cached.users:
+            continue
+        del _source_cache[old_key]
+        total_size -= cached.size
+        cached.free()
+
+
+def clear_source_cache():
+    """
+    Free all cached source geometry. Only call this while no transfer is running.
+    """
+    for geometry in _source_cache.values():
+        geometry.free()
+    _source_cache.clear()
+
+
+@persistent
+def invalidate_source_cache(scene, depsgraph):
+    """
+    Mark the cached geometry of sources that were edited or moved as stale,
+    since their cache key won't match anymore anyways.
+    This can run in the middle of a transfer, eg. from evaluated_depsgraph_get(),
+    so the geometry is only freed by the next cache lookup, once nothing uses it.
+    """
+    if not _source_cache:
+        return
+    pointers = set()
+    for update in depsgraph.updates:
+        if update.is_updated_geometry or update.is_updated_transform:
+            pointers.add(update.id.original.as_pointer())
+    if not pointers:
+        return
+    for key, geometry in _source_cache.items():
+        if key[0] in pointers or key[1] in pointers:
+            geometry.stale = True
+
+
+@persistent
+def clear_source_cache_on_load(_dummy=None):
+    clear_source_cache()
+
+
+def get_correspondence_cache_dir():
+    """
+    Return the folder of correspondence cache files, next to the .blend file,
+    or in Blender's session temp folder for unsaved files.
+    """
+    if bpy.data.filepath:
+        return os.path.splitext(bpy.data.filepath)[0] + "_transfer_cache"
+    return os.path.join(bpy.app.tempdir, "transfer_cache")
+
+
+def get_correspondence_cache_files():
+    cache_dir = get_correspondence_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return []
+    return [
+        os.path.join(cache_dir, name)
+        for name in sorted(os.listdir(cache_dir))
+        if name.endswith(".npz")
+    ]
+
+
+def load_correspondence(key):
+    """
+    Return the cached correspondence arrays of a key, or None.
+    """
+    path = os.path.join(get_correspondence_cache_dir(), key + ".npz")
+    if not os.path.isfile(path):
+        return
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError) as e:
+        print("Mesh Data Transfer: Ignoring unreadable cache file {}: {}".format(path, e))
+
+
+def save_correspondence(key, **arrays):
+    cache_dir = get_correspondence_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez_compressed(os.path.join(cache_dir, key + ".npz"), **arrays)
+
+
+class SparseWeights:
+    """
+    Vertex group weights in compressed sparse row form. Group i has the weights
+    weights[indptr[i]:indptr[i + 1]] on the vertices indices[indptr[i]:indptr[i + 1]],
+    so memory scales with the number of non-zero weights, not groups * vertices.
+    """
+
+    def __init__(self, indptr, indices, weights, v_count):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.v_count = v_count
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self):
+        return len(self.weights)
+
+    @classmethod
+    def from_triples(cls, groups, vertices, weights, group_count, v_count):
+        """
+        Build from parallel sequences of group index, vertex index and weight, in any order.
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        vertices = np.asarray(vertices, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+        # Ignore weights of group indices that don't exist.
+        valid = (groups >= 0) & (groups < group_count)
+        groups, vertices, weights = groups[valid], vertices[valid], weights[valid]
+        order = np.argsort(groups, kind="stable")
+        indptr = np.zeros(group_count + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(groups, minlength=group_count))
+        return cls(indptr, vertices[order], weights[order], v_count)
+
+    @classmethod
+    def from_rows(cls, rows, v_count):
+        """
+        Build from an iterable of dense weight arrays, one per group, keeping only non-zero weights.
+        """
+        indptr = [0]
+        indices = []
+        weights = []
+        for row in rows:
+            row = np.asarray(row, dtype=np.float32).ravel()
+            nonzero = np.flatnonzero(row)
+            indices.append(nonzero)
+            weights.append(row[nonzero])
+            indptr.append(indptr[-1] + len(nonzero))
+        if not weights:
+            return cls(
+                np.zeros(1, dtype=np.int64),
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.float32),
+                v_count,
+            )
+        return cls(
+            np.array(indptr, dtype=np.int64),
+            np.concatenate(indices),
+            np.concatenate(weights),
+            v_count,
+        )
+
+    @classmethod
+    def from_dense(cls, dense):
+        return cls.from_rows(dense, dense.shape[1])
+
+    def row(self, i):
+        """
+        Return the vertex indices and weights of a group.
+        """
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def dense_row(self, i):
+        dense = np.zeros(self.v_count, dtype=np.float32)
+        indices, weights = self.row(i)
+        dense[indices] = weights
+        return dense
+
+    def to_dense(self):
+        dense = np.zeros((len(self), self.v_count), dtype=np.float32)
+        groups = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        dense[groups, self.indices] = self.weights
+        return dense
+
+    def normalize(self, vertex_mask=None, group_mask=None, other_totals=None):
+        """
+        Scale the weights of each vertex so they add up to 1 across all groups.
+        :param vertex_mask: only vertices where this is above zero are normalized
+        :param group_mask: only the groups where this is True are summed and scaled
+        :param other_totals: per vertex sum of weights in groups outside of these, which are
+            kept as they are, so these groups are scaled to add up to the rest of 1
+        """
+        entries = np.ones(self.nnz, dtype=bool)
+        if group_mask is not None:
+            entries = np.repeat(np.asarray(group_mask, dtype=bool), np.diff(self.indptr))
+        totals = self.totals(group_mask)
+        wanted = np.ones(self.v_count, dtype=np.float64)
+        if other_totals is not None:
+            wanted = np.clip(1.0 - other_totals, 0.0, 1.0)
+        scale = np.ones(self.v_count, dtype=np.float64)
+        weighted = totals > 0.0
+        if vertex_mask is not None:
+            weighted &= vertex_mask > 0.0
+        scale[weighted] = wanted[weighted] / totals[weighted]
+        self.weights[entries] = self.weights[entries] * scale[self.indices[entries]]
+
+    def totals(self, group_mask=None):
+        """
+        Return the sum of the weights of each vertex, across all groups or the groups where group_mask is True.
+        """
+        entries = np.ones(self.nnz, dtype=bool)
+        if group_mask is not None:
+            entries = np.repeat(np.asarray(group_mask, dtype=bool), np.diff(self.indptr))
+        return np.bincount(
+            self.indices[entries], weights=self.weights[entries], minlength=self.v_count
+        )
+
+    def select(self, rows):
+        """
+        Return the weights of only the given groups, in the given order.
+        """
+        return SparseWeights.from_rows(
+            (self.dense_row(i) for i in rows), self.v_count
+        )
+
+
+def write_vertex_group_weights(vertex_group, indices, weights):
+    """
+    Assign weights to the given vertices of a vertex group, with one add() call per distinct weight value.
+    Weights are clamped to the 0-1 range.
+    """
+    indices = np.asarray(indices)
+    if indices.size == 0:
+        return
+    weights = np.clip(np.asarray(weights, dtype=np.float32), 0.0, 1.0)
+    values, inverse = np.unique(weights, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1]
+    for value, ids in zip(values.tolist(), np.split(indices[order], splits)):
+        vertex_group.add(ids.tolist(), value, "REPLACE")
+
+
 class GreasePencilData:
     def __init__(
         self, obj, deformed=False, world_space=False, uv_space=False, triangulate=True
@@ -234,15 +541,45 @@ class MeshData:
         # BVHtree for point casting.
         self.bvhtree = None
         self.transfer_bmesh = None
+        # Whether the bmesh and BVHtree are owned by the source cache.
+        self.cached = False
+        self.geometry = None
+        # KDTrees for snapping to this mesh's vertices, by hash of the coordinates they were built from.
+        self.kdtrees = {}
 
         # The correspondance map of the uv_vertices to the mesh vert id.
         self.vertex_map = {}
 
     def free(self):
-        if self.transfer_bmesh:
+        if self.transfer_bmesh and not self.cached:
             self.transfer_bmesh.free()
+        self.transfer_bmesh = None
+        if self.geometry:
+            self.geometry.users -= 1
+            self.geometry = None
+        self.cached = False
         if self.bvhtree:
             self.bvhtree = None
+        self.kdtrees.clear()
+
+    def get_kdtree(self, coords, keep=True):
+        """
+        Return a KDTree of the given coordinates, reusing the one built for identical coordinates.
+        :param keep: store a newly built tree for later calls. False for coordinates
+            that are only searched once, like a shape key's, so the trees don't pile up
+        """
+        key = hashlib.blake2b(
+            np.ascontiguousarray(coords).tobytes(), digest_size=16
+        ).digest()
+        kd = self.kdtrees.get(key)
+        if kd is None:
+            kd = kdtree.KDTree(len(coords))
+            for i, co in enumerate(coords.tolist()):
+                kd.insert(co, i)
+            kd.balance()
+            if keep:
+                self.kdtrees[key] = kd
+        return kd
 
     @property
     def seam_edges(self):
@@ -309,73 +646,74 @@ class MeshData:
         edges.foreach_set("use_seam", edges_array)
 
     def get_vertex_group_weights(self, vertex_group_name):
-        v_groups = self.vertex_groups
-        v_group = None
-        for group in v_groups:
-            if group.name == vertex_group_name:
-                v_group = group.index
-                # print("{} id is {}".format(group.name, group.index))
+        v_group = self.vertex_groups.get(vertex_group_name)
         if v_group is None:
             return
+        v_group = v_group.index
         v_count = len(self.mesh.vertices)
         weights = np.zeros(v_count, dtype=np.float32)
         for v in self.mesh.vertices:
-            groups = v.groups
-            for group in groups:
-                i = group.group
-                if i == v_group:
-                    v_index = v.index
-                    weight = group.weight
-                    weights[v_index] = weight
+            for group in v.groups:
+                if group.group == v_group:
+                    weights[v.index] = group.weight
+                    break
         weights.shape = (v_count, 1)
         return weights
 
-    def get_vertex_groups_weights(self, ignore_locked=False):
+    def get_sparse_vertex_groups_weights(self, ignore_locked=False):
+        """
+        Read the weights of all vertex groups in a single pass over the vertices.
+        :return: SparseWeights with one row per vertex group
+        """
         v_groups = self.vertex_groups
         if not v_groups:
             return
-        # setting up the np.arrays
-        v_count = len(self.mesh.vertices)
-        v_groups_count = len(v_groups)
-
-        weights = np.zeros((v_count * v_groups_count), dtype=np.float32)
-        weights.shape = (v_groups_count, v_count)
-
+        groups = []
+        vertices = []
+        weights = []
         for v in self.mesh.vertices:
-            groups = v.groups
-            for group in groups:
-                i = group.group
-                v_index = v.index
-                weight = group.weight
-                weights[i, v_index] = weight
+            v_index = v.index
+            for group in v.groups:
+                groups.append(group.group)
+                vertices.append(v_index)
+                weights.append(group.weight)
+        sparse_weights = SparseWeights.from_triples(
+            groups, vertices, weights, len(v_groups), self.v_count
+        )
         if ignore_locked:
             array = self.get_locked_vertex_groups_array()
-            return weights[array]
-        return weights
+            return sparse_weights.select(np.flatnonzero(array))
+        return sparse_weights
+
+    def get_vertex_groups_weights(self, ignore_locked=False):
+        sparse_weights = self.get_sparse_vertex_groups_weights(ignore_locked)
+        if sparse_weights is None:
+            return
+        return sparse_weights.to_dense()
 
     def set_single_vgroup_weights(self, group_name, weights):
-        # Remove existing vertex group.
         v_group = self.vertex_groups.get(group_name)
         group_weights = weights.flatten()
-        v_ids = np.nonzero(group_weights)[0]
-        for v_id in v_ids:
-            value = group_weights[v_id]
-            v_group.add((int(v_id),), value, "REPLACE")
+        v_ids = np.flatnonzero(group_weights)
+        write_vertex_group_weights(v_group, v_ids, group_weights[v_ids])
         return v_group
 
     def set_multiple_vgroups_weights(self, weights, group_names):
-        for i in range(weights.shape[0]):
+        """
+        Replace vertex groups with the given weights.
+        :param weights: SparseWeights, or a dense (groups, vertices) array
+        """
+        if not isinstance(weights, SparseWeights):
+            weights = SparseWeights.from_dense(weights)
+        for i, group_name in enumerate(group_names):
             # Remove existing vertex group.
-            group_name = group_names[i]
             v_group = self.vertex_groups.get(group_name)
             if v_group:
                 self.vertex_groups.remove(v_group)
-            group_weights = weights[i]
-            v_ids = np.nonzero(group_weights)[0]
             v_group = self.obj.vertex_groups.new(name=group_name)
-            for v_id in v_ids:
-                value = group_weights[v_id]
-                v_group.add((int(v_id),), value, "REPLACE")
+            v_ids, values = weights.row(i)
+            nonzero = values != 0.0
+            write_vertex_group_weights(v_group, v_ids[nonzero], values[nonzero])
 
     def store_shape_keys_values(self):
         values = list()
@@ -407,13 +745,139 @@ class MeshData:
         if activate:
             shape_key.value = 1.0
 
-    def get_mesh_data(self):
+    def get_geometry_key(self):
+        """
+        Return a key that identifies the geometry get_mesh_data() would build,
+        by hashing the vertex positions, faces and UVs, which is much faster than building it.
+        """
+        if self.deformed:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            ob_eval = self.obj.evaluated_get(depsgraph)
+            mesh = ob_eval.to_mesh()
+        else:
+            mesh = self.mesh
+        digest = hashlib.blake2b(digest_size=16)
+        attributes = [
+            (mesh.vertices, "co", 3, np.float32),
+            (mesh.polygons, "loop_start", 1, np.int32),
+            (mesh.loops, "vertex_index", 1, np.int32),
+        ]
+        if self.uv_space:
+            attributes.append((mesh.uv_layers.active.data, "uv", 2, np.float32))
+        for collection, attribute, size, dtype in attributes:
+            array = np.zeros(len(collection) * size, dtype=dtype)
+            collection.foreach_get(attribute, array)
+            digest.update(array.tobytes())
+        if self.deformed:
+            ob_eval.to_mesh_clear()
+        if self.world_space:
+            digest.update(np.array(self.obj.matrix_world, dtype=np.float32).tobytes())
+        return (
+            self.obj.as_pointer(),
+            self.mesh.as_pointer(),
+            self.deformed,
+            self.world_space,
+            self.uv_space,
+            self.triangulate,
+            digest.hexdigest(),
+        )
+
+    def get_mesh_data(self, use_cache=False, build_bvhtree=True):
         """
         Builds a BVHTree with a triangulated version of the mesh
         :param deformed: will sample the deformed mesh
         :param transformed:  will sample the mesh in world space
         :param uv_space: will sample the mesh in UVspace
+        :param use_cache: reuse the geometry from a previous transfer if the mesh didn't change
+        :param build_bvhtree: False if only the vertices are needed
         """
+        if use_cache:
+            key = self.get_geometry_key()
+            geometry = get_cached_source_geometry(key)
+            if not geometry or geometry.stale:
+                self.build_mesh_data()
+                geometry = SourceGeometry(
+                    self.transfer_bmesh, self.bvhtree, self.vertex_map
+                )
+                add_cached_source_geometry(key, geometry)
+            self.transfer_bmesh = geometry.transfer_bmesh
+            self.bvhtree = geometry.bvhtree
+            self.vertex_map = geometry.vertex_map
+            geometry.users += 1
+            self.cached = True
+            self.geometry = geometry
+            return
+        self.build_mesh_data(build_bvhtree)
+
+    def read_transfer_mesh(self):
+        """
+        Copy the transfer bmesh to a temporary mesh, so its data can be read with foreach_get.
+        The caller must remove the mesh.
+        """
+        mesh = bpy.data.meshes.new("mesh")
+        self.transfer_bmesh.to_mesh(mesh)
+        return mesh
+
+    def get_transfer_vertex_arrays(self):
+        """
+        Return the coordinates and normals of the transfer bmesh vertices
+        :return: (np.array, np.array)
+        """
+        mesh = self.read_transfer_mesh()
+        v_count = len(mesh.vertices)
+        co = np.zeros(v_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        normals = np.zeros(v_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("normal", normals)
+        bpy.data.meshes.remove(mesh)
+        return co.reshape(v_count, 3), normals.reshape(v_count, 3)
+
+    def get_vertex_map_arrays(self):
+        """
+        Flatten the vertex map into two arrays of transfer bmesh vertex ids
+        and the mesh vertex ids they correspond to.
+        :return: (np.array, np.array)
+        """
+        transfer_ids = np.fromiter(self.vertex_map.keys(), dtype=np.int64)
+        counts = np.fromiter(
+            (len(ids) for ids in self.vertex_map.values()), dtype=np.int64
+        )
+        mesh_ids = np.fromiter(
+            (v_id for ids in self.vertex_map.values() for v_id in ids), dtype=np.int64
+        )
+        return np.repeat(transfer_ids, counts), mesh_ids
+
+    def get_triangle_arrays(self):
+        """
+        Return the vertex coordinates of the triangulated transfer bmesh, the vertex ids of
+        each of its triangles, and the mesh vertex id for each of its vertices.
+        Triangle indices match the face indices returned by the BVHtree.
+        :return: (np.array, np.array, np.array)
+        """
+        if self.geometry and self.geometry.triangle_arrays:
+            return self.geometry.triangle_arrays
+        mesh = self.read_transfer_mesh()
+        v_count = len(mesh.vertices)
+        co = np.zeros(v_count * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        f_count = len(mesh.polygons)
+        loop_starts = np.zeros(f_count, dtype=np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        face_loops = np.zeros(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", face_loops)
+        bpy.data.meshes.remove(mesh)
+
+        triangles = face_loops[loop_starts[:, None] + np.arange(3)]
+        vertex_map = np.array(
+            [self.vertex_map[i][0] for i in range(v_count)], dtype=np.int64
+        )
+        arrays = (co.reshape(v_count, 3), triangles, vertex_map)
+        if self.geometry:
+            self.geometry.triangle_arrays = arrays
+            self.geometry.size += sum(array.nbytes for array in arrays)
+        return arrays
+
+    def build_mesh_data(self, build_bvhtree=True):
         deformed = self.deformed
         world_space = self.world_space
         uv_space = self.uv_space
@@ -474,7 +938,8 @@ class MeshData:
             )
         # self.transfer_bmesh.to_mesh(mesh)
 
-        self.bvhtree = BVHTree.FromBMesh(self.transfer_bmesh)
+        if build_bvhtree:
+            self.bvhtree = BVHTree.FromBMesh(self.transfer_bmesh)
 
     def generate_bmesh(self, deformed=True, world_space=True):
         """
@@ -600,10 +1065,17 @@ class MeshDataTransfer:
         exclude_muted_shapekeys=False,
         snap_to_closest=False,
         snap_to_closest_shape_key=False,
+        snap_shape_keys_to_basis_verts=False,
         transfer_drivers=False,
         source_arm=None,
         target_arm=None,
         restrict_to_selection=False,
+        normalize_weights=False,
+        prune_threshold=0.0,
+        half_precision_weights=False,
+        weights_chunk_size=32,
+        source_data=None,
+        correspondence_cache="NONE",
     ):
         self.vertex_group = vertex_group
         self.restrict_to_selection = restrict_to_selection
@@ -616,19 +1088,37 @@ class MeshDataTransfer:
         if self.uv_space:
             # automatically switching to closest if UV samlpes
             self.search_method = "CLOSEST"
-        self.source = MeshData(
-            source, uv_space=uv_space, deformed=deformed_source, world_space=world_space
-        )
-        self.source.get_mesh_data()
+        if source_data:
+            # Source MeshData shared between transfers to several targets.
+            self.source = source_data
+        else:
+            self.source = MeshData(
+                source,
+                uv_space=uv_space,
+                deformed=deformed_source,
+                world_space=world_space,
+            )
+        # Only the target's vertices are needed, so it's not triangulated and has no BVHtree.
         self.target = MeshData(
-            target, uv_space=uv_space, deformed=deformed_target, world_space=world_space
+            target,
+            uv_space=uv_space,
+            deformed=deformed_target,
+            world_space=world_space,
+            triangulate=False,
         )
-        self.target.get_mesh_data()
         self.invert_vertex_group = invert_vertex_group
         self.exclude_muted_shapekeys = exclude_muted_shapekeys
         self.exclude_locked_groups = exclude_locked_groups
         self.snap_to_closest = snap_to_closest
         self.snap_to_closest_shapekey = snap_to_closest_shape_key
+        # Snap every shape key to the source vertices found closest in the basis,
+        # rather than searching the closest vertices again in each shape key.
+        self.snap_shape_keys_to_basis_verts = snap_shape_keys_to_basis_verts
+        # vertex group transfer settings
+        self.normalize_weights = normalize_weights
+        self.prune_threshold = prune_threshold
+        self.half_precision_weights = half_precision_weights
+        self.weights_chunk_size = weights_chunk_size
 
         self.missed_projections = None
         self.ray_casted = None
@@ -636,13 +1126,79 @@ class MeshDataTransfer:
         self.related_ids = None  # this will store the indexing between
 
         self.transfer_drivers = transfer_drivers
+        # 'NONE', 'USE' to load and save the projection results, or 'REBUILD' to only save them.
+        self.correspondence_cache = correspondence_cache
+        self.correspondence_key = None
+        self.loaded_correspondence = False
+        if correspondence_cache != "NONE":
+            self.correspondence_key = self.get_correspondence_key()
+        if correspondence_cache == "USE":
+            self.loaded_correspondence = self.load_correspondence()
+        if not self.loaded_correspondence:
+            try:
+                self.project()
+            except Exception:
+                # The caller never gets this transfer to free, so release the meshes here.
+                self.free(free_source=not source_data)
+                raise
+            if self.correspondence_key:
+                self.save_correspondence()
+
+        self.source_arm = source_arm
+        self.target_arm = target_arm
+
+    def project(self):
+        """
+        Project the target vertices on the source, and calculate the barycentric coordinates.
+        """
+        if not self.source.bvhtree:
+            self.source.get_mesh_data(use_cache=True)
+        self.target.get_mesh_data(build_bvhtree=False)
         self.cast_verts()
+        # The target bmesh isn't needed after the projection.
+        self.target.free()
         self.barycentric_coords = self.get_barycentric_coords(
             self.ray_casted, self.hit_faces
         )
 
-        self.source_arm = source_arm
-        self.target_arm = target_arm
+    def get_correspondence_key(self):
+        """
+        Return a hash of both meshes' geometry and the search settings,
+        which determine the result of the projection.
+        """
+        # Leave out the pointers, which aren't the same in the next session.
+        description = repr(
+            (
+                CORRESPONDENCE_CACHE_VERSION,
+                self.source.get_geometry_key()[2:],
+                self.target.get_geometry_key()[2:],
+                self.search_method,
+            )
+        )
+        return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+    def load_correspondence(self):
+        data = load_correspondence(self.correspondence_key)
+        if not data or len(data["related_ids"]) != self.target.v_count:
+            return False
+        self.related_ids = data["related_ids"].astype(np.int64)
+        self.barycentric_coords = data["barycentric_coords"]
+        self.missed_projections = np.repeat(data["missed"][:, None], 3, axis=1)
+        return True
+
+    def save_correspondence(self):
+        try:
+            save_correspondence(
+                self.correspondence_key,
+                related_ids=self.related_ids.astype(np.int32),
+                barycentric_coords=self.barycentric_coords.astype(np.float32),
+                missed=self.missed_projections[:, 0],
+                source=np.array(self.source.obj.name),
+                target=np.array(self.target.obj.name),
+                search_method=np.array(self.search_method),
+            )
+        except OSError as e:
+            print("Mesh Data Transfer: Unable to save correspondence cache: {}".format(e))
 
     def get_vertices_mask(self):
         """
@@ -663,35 +1219,62 @@ class MeshDataTransfer:
         else:
             return selection
 
-    def free(self):
+    def free(self, free_source=True):
         """
         Free memory
+        :param free_source: False if the source is shared with other transfers
         :return:
         """
         if self.target:
             self.target.free()
-        if self.source:
+        if self.source and free_source:
             self.source.free()
 
-    def snap_coords_to_source_verts(self, coords, source_coords):
+    def find_closest_source_verts(self, coords, source_coords, keep_tree=True):
+        """
+        Find the index of the closest source vertex to each of the target coordinates
+        :param coords: target transformed coordinates
+        :param source_coords: source coordinates
+        :param keep_tree: keep the KDTree of the source coordinates on the source for later calls
+        :return: np.array of source vertex indices
+        """
+        find = self.source.get_kdtree(source_coords, keep_tree).find
+        return np.fromiter(
+            (find(co)[1] for co in coords.tolist()), dtype=np.int64, count=len(coords)
+        )
+
+    def snap_coords_to_source_verts(
+        self, coords, source_coords, closest_ids=None, keep_tree=True
+    ):
         """
         Find the closest vertex on source coordinates to the target coordinates
         :param coords: target transformed coordinates
         :param source_coords: source coordinates
+        :param closest_ids: previously found closest source vertex indices to reuse
+        :param keep_tree: keep the KDTree of the source coordinates on the source for later calls
         :return: snapped coordinates
         """
-        source_size = len(self.source.mesh.vertices)
-        kd = kdtree.KDTree(source_size)
-        snapped_coords = coords
-        for i, co in enumerate(source_coords):
-            kd.insert(co, i)
-        kd.balance()
-        for i in range(len(coords)):
-            co = coords[i]
-            snapped = kd.find(co)
+        if closest_ids is None:
+            closest_ids = self.find_closest_source_verts(
+                coords, source_coords, keep_tree
+            )
+        return source_coords[closest_ids]
 
-            snapped_coords[i] = snapped[0]
-        return snapped_coords
+    def find_basis_closest_source_verts(self, base_coords):
+        """
+        Find the index of the closest source vertex to each transferred vertex in the basis shape
+        :param base_coords: source basis coordinates
+        :return: np.array of source vertex indices
+        """
+        snap_coords = base_coords
+        if self.world_space:
+            mat = np.array(self.source.obj.matrix_world)
+            snap_coords = self.transform_vertices_array(snap_coords, mat)
+        if self.search_method == "TOPOLOGY":
+            snap_transferred = snap_coords
+        else:
+            snap_transferred = self.get_transferred_vert_coords(snap_coords)
+        return self.find_closest_source_verts(snap_transferred, snap_coords)
 
     def transfer_shape_keys(self):
         shape_keys = self.source.get_shape_keys_vert_pos(
@@ -717,6 +1300,10 @@ class MeshDataTransfer:
         )
         masked_vertices = self.get_vertices_mask()
         target_shape_keys = self.target.get_shape_keys_vert_pos()
+
+        # Closest source vertices in the basis shape, only searched if a shape key can reuse them.
+        basis_closest_ids = None
+
         for sk in shape_keys:
             sk_points = shape_keys[sk]
             if self.world_space:
@@ -728,8 +1315,19 @@ class MeshDataTransfer:
                 transferred_sk = self.get_transferred_vert_coords(sk_points)
             # snap to vertices
             if self.snap_to_closest_shapekey:
+                closest_ids = None
+                # Shape keys that don't move any vertex have the same closest vertices as the basis.
+                if self.snap_shape_keys_to_basis_verts or np.array_equal(
+                    shape_keys[sk], base_coords
+                ):
+                    if basis_closest_ids is None:
+                        basis_closest_ids = self.find_basis_closest_source_verts(
+                            base_coords
+                        )
+                    closest_ids = basis_closest_ids
+                # Only the basis tree is kept, each shape key's tree is dropped after use.
                 transferred_sk = self.snap_coords_to_source_verts(
-                    transferred_sk, sk_points
+                    transferred_sk, sk_points, closest_ids, keep_tree=False
                 )
             if self.world_space:
                 mat = np.array(self.target.obj.matrix_world.inverted())
@@ -914,7 +1512,7 @@ class MeshDataTransfer:
         return True
 
     def transfer_vertex_groups(self):
-        source_weights = self.source.get_vertex_groups_weights(
+        source_weights = self.source.get_sparse_vertex_groups_weights(
             ignore_locked=self.exclude_locked_groups
         )
         weights_names = self.source.get_vertex_groups_names(
@@ -923,65 +1521,141 @@ class MeshDataTransfer:
         if not weights_names:
             return
         # getting existing target group weights
-        existing_target_weights = self.target.get_vertex_groups_weights(
+        existing_target_weights = self.target.get_sparse_vertex_groups_weights(
             ignore_locked=self.exclude_locked_groups
         )
         existing_target_weights_names = self.target.get_vertex_groups_names(
             ignore_locked=self.exclude_locked_groups
-        )
-        # setting up destination array
-        target_weights_shape = (len(weights_names), self.target.v_count)
-        target_weights = np.zeros(
-            (target_weights_shape[0] * target_weights_shape[1]), dtype=np.float32
-        )
-        target_weights.shape = target_weights_shape
+        ) or []
+        existing_rows = [
+            existing_target_weights_names.index(name)
+            if name in existing_target_weights_names
+            else -1
+            for name in weights_names
+        ]
         masked_vertices = self.get_vertices_mask()
-        # unpacking array
-        for i in range(len(weights_names)):
-            weight_name = weights_names[i]
-            # checking if the current vertex group is the masked one.
-            if self.search_method == "TOPOLOGY":
-                transferred_weights = self.source.get_vertex_group_weights(
-                    weight_name
-                ).flatten()
-            else:
-                source_weight = np.zeros(
-                    (source_weights[i].shape[0] * 3), dtype=np.float32
-                )
-                source_weight.shape = (source_weights[i].shape[0], 3)
-                source_weight[:, 0] = source_weights[i]
-                source_weight[:, 1] = source_weights[i]
-                source_weight[:, 2] = source_weights[i]
-
-                transferred_weights = self.get_transferred_vert_coords(source_weight)[
-                    :, 0
-                ]
+        has_mask = isinstance(masked_vertices, (np.ndarray, np.generic))
+        if has_mask:
+            masked_vertices = masked_vertices.flatten()
+
+        # Transfer groups in chunks, to limit the size of the dense (groups, vertices) arrays.
+        group_count = len(weights_names)
+        chunk_size = self.weights_chunk_size or group_count
+        group_ids = []
+        vertex_ids = []
+        values = []
+        for start in range(0, group_count, chunk_size):
+            groups = range(start, min(start + chunk_size, group_count))
+            transferred_weights = self.get_transferred_weights(source_weights, groups)
 
             # filter on vertex group
             # blending to existing weight map
-            existing_weight_map = None
-            if isinstance(masked_vertices, (np.ndarray, np.generic)):
-
-                if weight_name in existing_target_weights_names:
-                    target_weight_index = existing_target_weights_names.index(
-                        weight_name
+            if has_mask:
+                transferred_weights *= masked_vertices
+                inverted_masked_vertices = 1.0 - masked_vertices
+                for row, i in enumerate(groups):
+                    if existing_rows[i] < 0:
+                        continue
+                    existing_indices, existing_weights = existing_target_weights.row(
+                        existing_rows[i]
                     )
-                    existing_weight_map = existing_target_weights[target_weight_index]
-                    existing_weight_map.reshape(transferred_weights.shape)
-                    inverted_masked_vertices = 1.0 - masked_vertices
-                    inverted_masked_vertices = inverted_masked_vertices.flatten()
-                    existing_weight_map = existing_weight_map * inverted_masked_vertices
-                transferred_weights = transferred_weights * masked_vertices.flatten()
-
-            if isinstance(existing_weight_map, (np.ndarray, np.generic)):
-                transferred_weights = np.sum(
-                    [transferred_weights, existing_weight_map], axis=0
-                )
+                    transferred_weights[row, existing_indices] += (
+                        existing_weights * inverted_masked_vertices[existing_indices]
+                    )
+
+            if self.prune_threshold > 0.0:
+                transferred_weights[transferred_weights < self.prune_threshold] = 0.0
+
+            rows, columns = np.nonzero(transferred_weights)
+            group_ids.append(rows + start)
+            vertex_ids.append(columns)
+            values.append(transferred_weights[rows, columns])
 
-            target_weights[i] = transferred_weights
+        target_weights = SparseWeights.from_triples(
+            np.concatenate(group_ids),
+            np.concatenate(vertex_ids),
+            np.concatenate(values),
+            group_count,
+            self.target.v_count,
+        )
+        if self.normalize_weights:
+            target_weights.normalize(
+                masked_vertices if has_mask else None,
+                self.get_deform_groups_mask(weights_names),
+                self.get_untransferred_deform_totals(weights_names),
+            )
         self.target.set_multiple_vgroups_weights(target_weights, weights_names)
         return True
 
+    def get_deform_groups_mask(self, group_names):
+        """
+        Return which of the groups belong to a deforming bone of the target's armatures,
+        like Blender's own normalize, or None if the target isn't deformed by an armature.
+        """
+        armatures = {
+            mod.object
+            for mod in self.target.obj.modifiers
+            if mod.type == "ARMATURE" and mod.object
+        }
+        if self.target.obj.parent and self.target.obj.parent.type == "ARMATURE":
+            armatures.add(self.target.obj.parent)
+        if self.target_arm:
+            armatures.add(self.target_arm)
+        if not armatures:
+            return None
+        deform_names = {
+            bone.name
+            for armature in armatures
+            for bone in armature.data.bones
+            if bone.use_deform
+        }
+        return np.array([name in deform_names for name in group_names], dtype=bool)
+
+    def get_untransferred_deform_totals(self, transferred_names):
+        """
+        Return the per vertex sum of the target's deform groups that aren't being transferred,
+        which stay on the target and count towards normalization, or None if there are none.
+        """
+        target_names = self.target.get_vertex_groups_names() or []
+        transferred_names = set(transferred_names)
+        other_groups = np.array(
+            [name not in transferred_names for name in target_names], dtype=bool
+        )
+        deform_groups = self.get_deform_groups_mask(target_names)
+        if deform_groups is not None:
+            other_groups &= deform_groups
+        if not other_groups.any():
+            return None
+        return self.target.get_sparse_vertex_groups_weights().totals(other_groups)
+
+    def get_transferred_weights(self, source_weights, groups):
+        """
+        Interpolate the weights of several source vertex groups onto the target at once,
+        using the related vertex ids and barycentric coordinates of the projection.
+        :param source_weights: SparseWeights of the source
+        :param groups: indices of the groups to transfer
+        :return: np.array of shape (groups, target vertices)
+        """
+        dtype = np.float16 if self.half_precision_weights else np.float32
+        source_block = np.zeros((len(groups), source_weights.v_count), dtype=dtype)
+        for row, i in enumerate(groups):
+            indices, weights = source_weights.row(i)
+            source_block[row, indices] = weights
+        if self.search_method == "TOPOLOGY":
+            return source_block.astype(np.float32)
+
+        transferred_weights = np.zeros(
+            (len(groups), len(self.related_ids)), dtype=np.float32
+        )
+        for corner in range(3):
+            transferred_weights += (
+                source_block[:, self.related_ids[:, corner]]
+                * self.barycentric_coords[:, corner]
+            )
+        # Vertices that missed the source have no valid barycentric coordinates.
+        transferred_weights[:, self.missed_projections[:, 0]] = 0.0
+        return transferred_weights
+
     def get_projected_vertices_on_source(self):
         """
         Return the coordinates of the vertices projected on the source mesh
@@ -1064,7 +1738,7 @@ class MeshDataTransfer:
         # sorting verts coordinates
         sorted_coords = transfer_coord[indexes]
         # reshaping the array
-        sorted_coords.shape = self.hit_faces.shape
+        sorted_coords.shape = (len(self.related_ids), 3, transfer_coord.shape[1])
         transferred_position = self.calculate_barycentric_location(
             sorted_coords, self.barycentric_coords
         )
@@ -1193,66 +1867,86 @@ class MeshDataTransfer:
         :param search_method:
         :return:
         '''
+        target_co, target_normals = self.target.get_transfer_vertex_arrays()
+        source_co, triangles, source_map = self.source.get_triangle_arrays()
+        bvhtree = self.source.bvhtree
+
+        # Projected location and hit triangle for each vertex of the target transfer bmesh.
+        # Vertices that miss keep their own position.
+        count = len(target_co)
+        locations = target_co.copy()
+        face_ids = np.full(count, -1, dtype=np.int64)
+        all_ids = np.arange(count)
+
+        if self.search_method == "CLOSEST":
+            self.project_vertices(
+                bvhtree.find_nearest, target_co, None, all_ids, locations, face_ids
+            )
+        else:
+            if self.uv_space:
+                target_normals = np.zeros((count, 3), dtype=np.float32)
+                target_normals[:, 2] = 1.0
+            self.project_vertices(
+                bvhtree.ray_cast, target_co, target_normals, all_ids, locations, face_ids
+            )
+            # project in the opposite direction if the ray misses
+            missed = np.flatnonzero(face_ids < 0)
+            self.project_vertices(
+                bvhtree.ray_cast, target_co, -target_normals, missed, locations, face_ids
+            )
+
+        # Scatter the results to the target mesh vertices.
+        # When several transfer vertices map to one mesh vertex, the last one wins.
+        transfer_ids, mesh_ids = self.target.get_vertex_map_arrays()
+        hit = face_ids[transfer_ids] >= 0
+        hit_mesh_ids = mesh_ids[hit]
+        hit_triangles = triangles[face_ids[transfer_ids[hit]]]
 
-        self.target.transfer_bmesh.verts.ensure_lookup_table()
         v_count = len(self.target.mesh.vertices)
         # np array with coordinates
-        self.ray_casted = np.zeros(v_count * 3, dtype=np.float32)
-        self.ray_casted.shape = (v_count, 3)
+        self.ray_casted = np.zeros((v_count, 3), dtype=np.float32)
+        self.ray_casted[mesh_ids] = locations[transfer_ids]
         # np array with the triangles
-        self.hit_faces = np.zeros(v_count * 9, dtype=np.float32)
-        self.hit_faces.shape = (v_count, 3, 3)
-
+        self.hit_faces = np.zeros((v_count, 3, 3), dtype=np.float32)
+        self.hit_faces[hit_mesh_ids] = source_co[hit_triangles]
         # get the ids of the hit vertices
-        self.related_ids = np.zeros(v_count * 3, dtype=np.int64)
-        self.related_ids.shape = (v_count, 3)
+        self.related_ids = np.zeros((v_count, 3), dtype=np.int64)
+        self.related_ids[hit_mesh_ids] = source_map[hit_triangles]
+        # np bool array with hit verts
+        self.missed_projections = np.ones((v_count, 3), dtype=bool)
+        self.missed_projections[hit_mesh_ids] = False
 
-        self.source.transfer_bmesh.faces.ensure_lookup_table()
+        return self.ray_casted, self.hit_faces, self.related_ids
 
-        # np bool array with hit verts
-        self.missed_projections = np.ones(v_count * 3, dtype=bool)
-        self.missed_projections.shape = (v_count, 3)
-        v_normal = Vector((0.0, 0.0, 1.0))
-        for v in self.target.transfer_bmesh.verts:
-            v_ids = self.target.vertex_map[
-                v.index
-            ]  # gets the correspondent vert to the UV_mesh
-
-            if self.search_method == "CLOSEST":
-                projection = self.source.bvhtree.find_nearest(v.co)
+    @staticmethod
+    def project_vertices(
+        query, co, directions, indices, locations, face_ids, chunk_size=PROJECTION_CHUNK_SIZE
+    ):
+        """
+        Run a BVHtree query for the given vertices, in chunks,
+        and write the hit locations and face indices into the given arrays.
+        :param query: BVHTree.find_nearest or BVHTree.ray_cast
+        :param co: coordinates of all vertices
+        :param directions: ray directions of all vertices, or None for find_nearest
+        :param indices: ids of the vertices to project
+        """
+        for start in range(0, len(indices), chunk_size):
+            chunk = indices[start : start + chunk_size]
+            if directions is None:
+                results = [query(point) for point in co[chunk].tolist()]
             else:
-                if not self.uv_space:
-                    v_normal = v.normal
-                projection = self.source.bvhtree.ray_cast(v.co, v_normal)
-                # project in the opposite direction if the ray misses
-                if not projection[0]:
-                    projection = self.source.bvhtree.ray_cast(v.co, (v_normal * -1.0))
-            if projection[0]:
-                for v_id in v_ids:
-                    self.ray_casted[v_id] = projection[0]
-                    self.missed_projections[v_id] = False
-                    face = self.source.transfer_bmesh.faces[projection[2]]
-                    self.hit_faces[v_id] = (
-                        face.verts[0].co,
-                        face.verts[1].co,
-                        face.verts[2].co,
+                results = [
+                    query(point, direction)
+                    for point, direction in zip(
+                        co[chunk].tolist(), directions[chunk].tolist()
                     )
-                    # getting the related vertex ids
-                    v1_id, v2_id, v3_id = (
-                        face.verts[0].index,
-                        face.verts[1].index,
-                        face.verts[2].index,
-                    )
-                    v1_id = self.source.vertex_map[v1_id][0]
-                    v2_id = self.source.vertex_map[v2_id][0]
-                    v3_id = self.source.vertex_map[v3_id][0]
-                    v_array = np.array([v1_id, v2_id, v3_id])
-
-                    self.related_ids[v_id] = v_array
-            else:
-                for v_id in v_ids:
-                    self.ray_casted[v_id] = v.co
-        return self.ray_casted, self.hit_faces, self.related_ids
+                ]
+            hits = [i for i, result in enumerate(results) if result[0] is not None]
+            if not hits:
+                continue
+            hit_ids = chunk[hits]
+            locations[hit_ids] = [results[i][0] for i in hits]
+            face_ids[hit_ids] = [results[i][2] for i in hits]
 
     @staticmethod
     def get_barycentric_coords(verts_co, triangles):
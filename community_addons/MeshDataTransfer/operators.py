@@ -1,6 +1,14 @@
 import bpy
+import numpy as np
+import os
+from time import perf_counter
 
-from .mesh_data_transfer import MeshDataTransfer, TopologyData
+from .mesh_data_transfer import (
+    MeshDataTransfer,
+    TopologyData,
+    get_correspondence_cache_dir,
+    get_correspondence_cache_files,
+)
 
 
 class TransferShapeKeyDrivers(bpy.types.Operator):
@@ -76,6 +84,12 @@ class TransferMeshData(bpy.types.Operator):
     bl_label = "Transfer Mesh Data"
     bl_options = {'REGISTER', 'UNDO'}
 
+    selected_targets: bpy.props.BoolProperty(
+        name="All Selected",
+        description="Transfer to all selected meshes with the settings of the active object, building the source data only once",
+        default=False,
+    )
+
     @classmethod
     def poll(cls, context):
         attributes_to_transfer = (
@@ -124,39 +138,204 @@ class TransferMeshData(bpy.types.Operator):
 
         if sample_space == 'WORLD':
             world_space = True
-        transfer_data = MeshDataTransfer(
-            target=active,
-            source=source,
-            world_space=world_space,
-            deformed_source=deformed_source,
-            invert_vertex_group=invert_mask,
-            uv_space=uv_space,
-            search_method=search_method,
-            vertex_group=mask_vertex_group,
-            snap_to_closest=snap_to_closest,
-            restrict_to_selection=restrict_selection,
-            exclude_muted_shapekeys=exclude_muted_shapekeys,
-            snap_to_closest_shape_key=snap_to_closest_shapekey,
-            exclude_locked_groups=exclude_locked_groups,
-        )
+
+        targets = [active]
+        if self.selected_targets:
+            targets += [
+                ob
+                for ob in context.selected_objects
+                if ob.type == 'MESH' and ob not in (active, source)
+            ]
 
         attribute_to_transfer = active_prop.attributes_to_transfer
-        if attribute_to_transfer == "SHAPE":
-            transferred = transfer_data.transfer_vertex_position(
-                as_shape_key=as_shape_key
-            )
-        elif attribute_to_transfer == "UVS":
-            transferred = transfer_data.transfer_uvs()
-        elif attribute_to_transfer == "SHAPE_KEYS":
-            transferred = transfer_data.transfer_shape_keys()
-        elif attribute_to_transfer == "VERTEX_GROUPS":
-            transferred = transfer_data.transfer_vertex_groups()
-        transfer_data.free()
-        bpy.ops.object.mode_set(mode=current_mode)
-        bpy.context.view_layer.objects.active = active
-        if not transferred:
-            self.report({'INFO'}, 'Unable to perform the operation.')
+        window_manager = context.window_manager
+        window_manager.progress_begin(0, len(targets))
+        # The source data is built by the first transfer, and reused for the rest.
+        source_data = None
+        timings = []
+        # (target name, reason)
+        skipped = []
+        try:
+            for i, target in enumerate(targets):
+                if search_method == "TOPOLOGY" and len(target.data.vertices) != len(
+                    source.data.vertices
+                ):
+                    skipped.append((target.name, "vertex count differs from the source"))
+                    continue
+                # The mask is looked up by name, so a target without it would be transferred unmasked.
+                if mask_vertex_group and not target.vertex_groups.get(mask_vertex_group):
+                    skipped.append(
+                        (target.name, f'no "{mask_vertex_group}" vertex group to mask with')
+                    )
+                    continue
+                start = perf_counter()
+                transfer_data = None
+                try:
+                    transfer_data = MeshDataTransfer(
+                        target=target,
+                        source=source,
+                        world_space=world_space,
+                        deformed_source=deformed_source,
+                        invert_vertex_group=invert_mask,
+                        uv_space=uv_space,
+                        search_method=search_method,
+                        vertex_group=mask_vertex_group,
+                        snap_to_closest=snap_to_closest,
+                        restrict_to_selection=restrict_selection,
+                        exclude_muted_shapekeys=exclude_muted_shapekeys,
+                        snap_to_closest_shape_key=snap_to_closest_shapekey,
+                        snap_shape_keys_to_basis_verts=active_prop.snap_shapekey_to_basis_verts,
+                        exclude_locked_groups=exclude_locked_groups,
+                        normalize_weights=active_prop.normalize_vertex_groups,
+                        prune_threshold=active_prop.prune_vertex_groups_threshold,
+                        half_precision_weights=active_prop.vertex_groups_half_precision,
+                        weights_chunk_size=active_prop.vertex_groups_chunk_size,
+                        source_data=source_data,
+                        correspondence_cache=(
+                            "USE" if active_prop.use_correspondence_cache else "NONE"
+                        ),
+                    )
+                    source_data = transfer_data.source
+
+                    if attribute_to_transfer == "SHAPE":
+                        transferred = transfer_data.transfer_vertex_position(
+                            as_shape_key=as_shape_key
+                        )
+                    elif attribute_to_transfer == "UVS":
+                        transferred = transfer_data.transfer_uvs()
+                    elif attribute_to_transfer == "SHAPE_KEYS":
+                        transferred = transfer_data.transfer_shape_keys()
+                    elif attribute_to_transfer == "VERTEX_GROUPS":
+                        transferred = transfer_data.transfer_vertex_groups()
+                finally:
+                    # Free the target right away, to keep memory use flat over many targets.
+                    if transfer_data:
+                        transfer_data.free(free_source=False)
+                if transferred:
+                    timings.append((target.name, perf_counter() - start))
+                else:
+                    skipped.append((target.name, "nothing to transfer"))
+                window_manager.progress_update(i + 1)
+        finally:
+            window_manager.progress_end()
+            if source_data:
+                source_data.free()
+            bpy.ops.object.mode_set(mode=current_mode)
+            bpy.context.view_layer.objects.active = active
+
+        if self.selected_targets:
+            for name, seconds in timings:
+                print(f"Mesh Data Transfer: {name}: {seconds:.3f}s")
+            for name, reason in skipped:
+                print(f"Mesh Data Transfer: {name}: skipped, {reason}")
+        if not timings:
+            if skipped:
+                self.report({'INFO'}, f"Unable to perform the operation: {skipped[0][1]}.")
+            else:
+                self.report({'INFO'}, 'Unable to perform the operation.')
             return {'CANCELLED'}
+        if self.selected_targets:
+            total = sum(seconds for _name, seconds in timings)
+            message = f"Transferred to {len(timings)} meshes in {total:.2f}s"
+            if skipped:
+                message += f", {len(skipped)} skipped"
+            self.report({'INFO'}, message + ". See console for details.")
+
+        return {'FINISHED'}
+
+
+class MeshDataTransferCache(bpy.types.Operator):
+    """Inspect, rebuild or purge the cached vertex correspondences between meshes"""
+
+    bl_idname = "object.mesh_data_transfer_cache"
+    bl_label = "Correspondence Cache"
+    bl_options = {'REGISTER'}
+
+    action: bpy.props.EnumProperty(
+        items=[
+            ('INSPECT', 'Inspect', "Print the cached correspondences to the console", 1),
+            (
+                'REBUILD',
+                'Rebuild',
+                "Project the active object on its source again, and cache the result",
+                2,
+            ),
+            ('PURGE', 'Purge', "Delete all cached correspondences of this file", 3),
+        ],
+        name="Action",
+        default='INSPECT',
+    )
+
+    def execute(self, context):
+        cache_files = get_correspondence_cache_files()
+        if self.action == 'INSPECT':
+            total_size = 0
+            for path in cache_files:
+                size = os.path.getsize(path)
+                total_size += size
+                try:
+                    with np.load(path) as data:
+                        print(
+                            "Mesh Data Transfer: {} -> {} ({}), {} vertices, {} missed, {:.1f} KB".format(
+                                data["source"],
+                                data["target"],
+                                data["search_method"],
+                                len(data["related_ids"]),
+                                int(data["missed"].sum()),
+                                size / 1024,
+                            )
+                        )
+                except (OSError, ValueError, KeyError):
+                    print("Mesh Data Transfer: Unreadable cache file: {}".format(path))
+            self.report(
+                {'INFO'},
+                "{} cached correspondences, {:.1f} MB in {}. See console for details.".format(
+                    len(cache_files),
+                    total_size / 1024 / 1024,
+                    get_correspondence_cache_dir(),
+                ),
+            )
+
+        elif self.action == 'PURGE':
+            failed = 0
+            for path in cache_files:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print("Mesh Data Transfer: Unable to delete cache file {}: {}".format(path, e))
+                    failed += 1
+            if failed:
+                self.report(
+                    {'WARNING'},
+                    "Deleted {} cached correspondences, {} could not be deleted. See console for details.".format(
+                        len(cache_files) - failed, failed
+                    ),
+                )
+            else:
+                self.report(
+                    {'INFO'}, "Deleted {} cached correspondences.".format(len(cache_files))
+                )
+
+        elif self.action == 'REBUILD':
+            active = context.active_object
+            active_prop = active.mesh_data_transfer_object
+            source = active_prop.mesh_source
+            if not source:
+                self.report({'ERROR'}, "Pick a source mesh first.")
+                return {'CANCELLED'}
+            transfer_data = MeshDataTransfer(
+                target=active,
+                source=source,
+                world_space=active_prop.mesh_object_space == 'WORLD',
+                deformed_source=active_prop.transfer_modified_source,
+                uv_space=active_prop.search_method == 'UVS',
+                search_method=active_prop.search_method,
+                correspondence_cache="REBUILD",
+            )
+            transfer_data.free()
+            self.report(
+                {'INFO'}, "Cached correspondence of {} to {}.".format(source.name, active.name)
+            )
 
         return {'FINISHED'}
 
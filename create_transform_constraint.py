@@ -1,5 +1,19 @@
 import bpy
+import re
 from bpy.types import Operator
+from bpy.utils import unescape_identifier
+from bpy_extras import anim_utils
+from . import utils
+
+# Matches F-Curve data paths of bone transforms, like 'pose.bones["Bone"].location'.
+BONE_TRANSFORM_PATH_RE = re.compile(
+    r'pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(location|rotation_euler|scale)$'
+)
+# Column offset of each transform type in the (frames, 9) arrays of bone transforms.
+TRANSFORM_COLUMNS = {'location': 0, 'rotation_euler': 3, 'scale': 6}
+REST_TRANSFORMS = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0)
+# Smallest change of each transform channel that counts as posed.
+POSED_THRESHOLDS = (0.00001,) * 3 + (0.0001,) * 3 + (0.0001,) * 3
 
 class POSE_OT_create_transform_constraint(Operator):
     """Create transform constraint on the active bone, targeting the selected one, based on current local transforms of the active bone"""
@@ -105,6 +119,164 @@ class POSE_OT_create_transform_constraint(Operator):
 
         return {'FINISHED'}
 
+def get_bone_transforms_per_frame(action, slot):
+    """Evaluate the Euler transforms of every bone keyed in an Action slot on every keyed frame.
+    Return the sorted keyed frames, and a dictionary of bone name : (frames, 9) array of
+    location, rotation and scale values.
+    """
+    import numpy as np
+    channelbag = anim_utils.action_get_channelbag_for_slot(action, slot)
+    if not channelbag:
+        return np.zeros(0), {}
+
+    curves = []
+    frames = set()
+    for fc in channelbag.fcurves:
+        match = BONE_TRANSFORM_PATH_RE.match(fc.data_path)
+        if not match or not 0 <= fc.array_index < 3:
+            continue
+        bone_name = unescape_identifier(match.group(1))
+        curves.append((bone_name, TRANSFORM_COLUMNS[match.group(2)] + fc.array_index, fc))
+        co = np.empty(len(fc.keyframe_points) * 2, dtype=np.float32)
+        fc.keyframe_points.foreach_get('co', co)
+        frames.update(co[0::2].tolist())
+
+    frames = np.array(sorted(frames))
+    transforms = {}
+    for bone_name, column, fc in curves:
+        if bone_name not in transforms:
+            transforms[bone_name] = np.tile(REST_TRANSFORMS, (len(frames), 1))
+        transforms[bone_name][:, column] = [fc.evaluate(f) for f in frames]
+    return frames, transforms
+
+
+def get_posed_transform_type(deltas):
+    """Return 1 if any rotation channel of a (frames, 9) array of deltas from rest is posed,
+    otherwise 0 if any location channel is, otherwise 2 for scale."""
+    import numpy as np
+    posed = (np.abs(deltas) > POSED_THRESHOLDS).reshape(-1, 3, 3).any(axis=(0, 2))
+    for transform_type in (1, 0, 2):
+        if posed[transform_type]:
+            return transform_type
+    return 2
+
+
+def set_transform_mapping(con, driver_values, driven_values, side):
+    """Set the from/to values of one side ('min' or 'max') of a Transform constraint
+    based on the transforms of the driver and driven bones in a single pose."""
+    axes = "xyz"
+    suffixes = {'LOCATION': "", 'ROTATION': "_rot", 'SCALE': "_scale"}
+    source_axis = axes.index(con.map_to_x_from.lower())
+    from_offset = {'LOCATION': 0, 'ROTATION': 3, 'SCALE': 6}[con.map_from]
+    setattr(
+        con,
+        f"from_{side}_{axes[source_axis]}{suffixes[con.map_from]}",
+        driver_values[from_offset + source_axis],
+    )
+    to_offset = {'LOCATION': 0, 'ROTATION': 3, 'SCALE': 6}[con.map_to]
+    for i, axis in enumerate(axes):
+        setattr(con, f"to_{side}_{axis}{suffixes[con.map_to]}", driven_values[to_offset + i])
+
+
+class POSE_OT_create_transform_constraints_from_action(Operator):
+    """Create Transform constraints from the poses in the active Action. On each keyed frame, exactly one selected bone should be posed; it drives every other keyed bone that is posed on that frame"""
+
+    bl_idname = "pose.create_transform_constraints_from_action"
+    bl_label = "Create Transform Constraints From Action"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        return (
+            obj and
+            obj.type == 'ARMATURE' and
+            context.mode == 'POSE' and
+            obj.animation_data and
+            obj.animation_data.action and
+            context.selected_pose_bones
+        )
+
+    def execute(self, context):
+        import numpy as np
+        rig = context.active_object
+        animdata = rig.animation_data
+        frames, transforms = get_bone_transforms_per_frame(animdata.action, animdata.action_slot)
+
+        driver_names = [pb.name for pb in context.selected_pose_bones if pb.name in transforms]
+        driven_names = [name for name in transforms if name not in driver_names]
+        if not driver_names or not driven_names:
+            self.report({'ERROR'}, "The active Action must key both selected (driver) and unselected (driven) bones.")
+            return {'CANCELLED'}
+
+        # (bones, frames, 9) arrays of how far each channel is from rest, and whether it counts as posed.
+        driver_values = np.stack([transforms[name] for name in driver_names])
+        driven_values = np.stack([transforms[name] for name in driven_names])
+        driver_posed = (np.abs(driver_values - REST_TRANSFORMS) > POSED_THRESHOLDS).any(axis=2)
+        driven_posed = (np.abs(driven_values - REST_TRANSFORMS) > POSED_THRESHOLDS).any(axis=2)
+
+        # Frames where exactly one driver bone is posed define a pose of that driver.
+        single_driver = driver_posed.sum(axis=0) == 1
+        ambiguous = np.flatnonzero(driver_posed.sum(axis=0) > 1)
+        frame_driver = driver_posed.argmax(axis=0)
+
+        created = 0
+        skipped = []
+        for driven_index, driven_name in enumerate(driven_names):
+            driven = rig.pose.bones.get(driven_name)
+            for driver_index, driver_name in enumerate(driver_names):
+                pose_frames = np.flatnonzero(
+                    single_driver & (frame_driver == driver_index) & driven_posed[driven_index]
+                )
+                if pose_frames.size == 0:
+                    continue
+                driver = rig.pose.bones.get(driver_name)
+                if not driver or not driven:
+                    continue
+                if any(pb.rotation_mode in {'QUATERNION', 'AXIS_ANGLE'} for pb in (driver, driven)):
+                    skipped.append(driven_name)
+                    continue
+
+                # Like the single-pose operator, prefer rotation over location over scale,
+                # then pick the driver axis that changes the most across all of its poses.
+                driver_deltas = driver_values[driver_index, pose_frames] - REST_TRANSFORMS
+                driven_deltas = driven_values[driven_index, pose_frames] - REST_TRANSFORMS
+                source_type = get_posed_transform_type(driver_deltas)
+                target_type = get_posed_transform_type(driven_deltas)
+                source_channel = source_type * 3 + int(
+                    np.abs(driver_deltas[:, source_type * 3:source_type * 3 + 3]).max(axis=0).argmax()
+                )
+
+                con = utils.find_or_create_constraint(driven, 'TRANSFORM', f"Transform {driver_name}")
+                con.target = rig
+                con.subtarget = driver_name
+                con.target_space = con.owner_space = 'LOCAL'
+                con.map_from = ('LOCATION', 'ROTATION', 'SCALE')[source_channel // 3]
+                con.map_to = ('LOCATION', 'ROTATION', 'SCALE')[target_type]
+                source_axis = "XYZ"[source_channel % 3]
+                for axis in "xyz":
+                    setattr(con, f"map_to_{axis}_from", source_axis)
+
+                # The poses with the largest negative and positive source value define the min and max sides.
+                source_values = driver_deltas[:, source_channel]
+                for side, frame_index in (('min', source_values.argmin()), ('max', source_values.argmax())):
+                    if (source_values[frame_index] < 0) != (side == 'min'):
+                        continue
+                    frame = pose_frames[frame_index]
+                    set_transform_mapping(
+                        con, driver_values[driver_index, frame], driven_values[driven_index, frame], side
+                    )
+                created += 1
+
+        if ambiguous.size:
+            print("Create Transform Constraints: Skipped frames with multiple posed driver bones: ", frames[ambiguous].tolist())
+        if skipped:
+            self.report({'WARNING'}, "Bones must have Euler rotation mode, skipped: " + ", ".join(sorted(set(skipped))))
+        self.report({'INFO'}, f"Created or updated {created} Transform constraints.")
+        return {'FINISHED'}
+
+
 registry = [
-    POSE_OT_create_transform_constraint
-]
\ No newline at end of file
+    POSE_OT_create_transform_constraint,
+    POSE_OT_create_transform_constraints_from_action,
+]
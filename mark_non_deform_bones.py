@@ -1,8 +1,36 @@
 import bpy
+from bpy.props import BoolProperty
 
-def has_vertex_group(obj, group_name):
-    """Check if the given object has a vertex group with the specified name."""
-    return group_name in obj.vertex_groups
+def get_deformed_meshes(armature, objects=None):
+    """Return mesh objects that are children of the armature, or deformed by it through an Armature modifier."""
+    if objects is None:
+        objects = bpy.data.objects
+    meshes = {obj for obj in armature.children if obj.type == 'MESH'}
+    for obj in objects:
+        if obj.type != 'MESH' or obj in meshes:
+            continue
+        if any(mod.type == 'ARMATURE' and mod.object == armature for mod in obj.modifiers):
+            meshes.add(obj)
+    return sorted(meshes, key=lambda obj: obj.name)
+
+def get_weighted_group_names(mesh_objects):
+    """Return the names of vertex groups that hold non-zero weight on any of the given meshes."""
+    weighted = set()
+    for obj in mesh_objects:
+        group_names = {vg.index: vg.name for vg in obj.vertex_groups}
+        # Groups already known to hold weight on another mesh don't need to be found again.
+        remaining = {i for i, name in group_names.items() if name not in weighted}
+        if not remaining:
+            continue
+        found = set()
+        for vert in obj.data.vertices:
+            for group in vert.groups:
+                if group.weight > 0.0:
+                    found.add(group.group)
+            if len(found) >= len(remaining) and remaining <= found:
+                break
+        weighted.update(group_names[i] for i in found if i in group_names)
+    return weighted
 
 class OBJECT_OT_uncheck_deform_bones(bpy.types.Operator):
     """Toggle the 'use_deform' property of bones if they don't deform any meshes"""
@@ -10,31 +38,42 @@ class OBJECT_OT_uncheck_deform_bones(bpy.types.Operator):
     bl_label = "Uncheck Deform Bones"
     bl_options = {'REGISTER', 'UNDO'}
 
+    dry_run: BoolProperty(
+        name="Dry Run",
+        description="Only report the bones that would be set to non-deform, without changing them",
+        default=False,
+    )
+
     @classmethod
     def poll(cls, context):
         return context.active_object and context.active_object.type == 'ARMATURE'
 
     def execute(self, context):
         armature = context.active_object
-        mesh_objects = [obj for obj in armature.children if obj.type == 'MESH']
-        
+        mesh_objects = get_deformed_meshes(armature)
+
         if not mesh_objects:
-            self.report({'WARNING'}, "No child mesh objects found.")
+            self.report({'WARNING'}, "No child or deformed mesh objects found.")
             return {'CANCELLED'}
 
+        weighted_groups = get_weighted_group_names(mesh_objects)
+
+        flipped = []
         for bone in armature.data.bones:
-            if bone.use_deform:
-                bone_has_group = any(
-                    has_vertex_group(mesh_obj, bone.name) for mesh_obj in mesh_objects
-                )
-                if not bone_has_group:
+            if bone.use_deform and bone.name not in weighted_groups:
+                flipped.append(bone.name)
+                if not self.dry_run:
                     bone.use_deform = False
-                    print("Set bone to non-deform: ", bone.name)
-        
-        self.report({'INFO'}, "Updated bone deform properties.")
-        return {'FINISHED'}
 
-registry = [OBJECT_OT_uncheck_deform_bones]
+        word = "Would set" if self.dry_run else "Set"
+        for bone_name in flipped:
+            print(f"{word} bone to non-deform: ", bone_name)
+
+        self.report(
+            {'INFO'},
+            f"{word} {len(flipped)} bones to non-deform, checked {len(mesh_objects)} meshes.",
+        )
+        return {'FINISHED'}
 
 def draw_uncheck_def_bones(self, context):
     layout = self.layout
@@ -1,6 +1,7 @@
 import bpy
 from bpy.types import AddonPreferences
 from bpy.props import BoolProperty
+from bpy.app.handlers import persistent
 from . import __package__ as base_package
 
 class MetsToolsPrefs(AddonPreferences):
@@ -8,27 +9,118 @@ class MetsToolsPrefs(AddonPreferences):
 
     auto_fix_whitespace: BoolProperty(
         name="Force Spaces",
-        description="Every few seconds, replace all tabs with spaces in any text editors",
+        description="Replace all tabs with spaces in any text editors, checking less often while nothing is being edited",
         default=True,
     )
 
     def draw(self, context):
-        self.layout.prop(self, 'auto_fix_whitespace')
+        layout = self.layout
+        layout.prop(self, 'auto_fix_whitespace')
 
-def force_spaces_timer() -> int:
+        from . import module_names, module_timings
+        box = layout.box()
+        box.label(text="Module Load Times", icon='TIME')
+        col = box.column(align=True)
+        for name in module_names:
+            timings = module_timings.get(name, {})
+            row = col.row()
+            row.label(text=name)
+            row.label(text=f"Import: {timings.get('import', 0) * 1000:.1f} ms")
+            row.label(text=f"Register: {timings.get('register', 0) * 1000:.1f} ms")
+        if not context.preferences.view.show_developer_ui:
+            box.label(text="Enable Developer Extras to reload modules when the add-on is re-enabled.", icon='INFO')
+
+# Seconds between checks for tabs. Doubled each time nothing changed, reset when something did.
+MIN_INTERVAL = 1.0
+MAX_INTERVAL = 30.0
+_interval = MIN_INTERVAL
+
+# Text pointer : (is_modified, line count, cursor line, cursor character) as of the last check.
+_text_states = {}
+
+_msgbus_owner = object()
+
+def get_displayed_texts(context=None):
+    """Return the texts shown in a Text Editor in any window, each only once."""
+    if not context:
+        context = bpy.context
+    texts = {}
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'TEXT_EDITOR':
+                continue
+            text = area.spaces.active.text
+            if text:
+                texts[text.as_pointer()] = text
+    return list(texts.values())
+
+def get_text_state(text) -> tuple:
+    """Return a cheap summary of a text that changes while it is being edited, without reading its contents."""
+    return (text.is_modified, len(text.lines), text.current_line_index, text.current_character)
+
+def replace_tabs(text, content):
+    """Replace tabs with spaces on only the lines of the text that contain them,
+    keeping the cursor and selection in place."""
+    cursor = [text.current_line_index, text.current_character, text.select_end_line_index, text.select_end_character]
+    lines = content.split("\n")
+    for i, line in enumerate(lines):
+        if "\t" not in line:
+            continue
+        text.region_from_string(line.replace("\t", "    "), range=((i, 0), (i, len(line))))
+        # Each tab before a cursor on this line moves it by 3 characters.
+        for j in (0, 2):
+            if cursor[j] == i:
+                cursor[j + 1] += line[:cursor[j + 1]].count("\t") * 3
+    text.select_set(*cursor)
+
+def force_spaces_timer() -> float:
+    global _interval
     prefs = get_addon_prefs()
     if not prefs.auto_fix_whitespace:
-        return 3
-    for a in bpy.context.screen.areas:
-        if a.type != 'TEXT_EDITOR':
+        _interval = MAX_INTERVAL
+        return _interval
+
+    changed = False
+    states = {}
+    for text in get_displayed_texts():
+        key = text.as_pointer()
+        state = get_text_state(text)
+        states[key] = state
+        if _text_states.get(key) == state:
             continue
-        text = a.spaces.active.text
-        if not text or not text.is_editable or text.indentation == 'SPACES':
+        changed = True
+        if not text.is_editable or text.indentation == 'SPACES':
             continue
         text.indentation = 'SPACES'
-        text.region_from_string(text.as_string().replace("\t", "    "), range=((0, 0), (-1, -1)))
+        content = text.as_string()
+        if "\t" in content:
+            replace_tabs(text, content)
+            states[key] = get_text_state(text)
+    _text_states.clear()
+    _text_states.update(states)
+
+    if changed:
+        _interval = MIN_INTERVAL
+    else:
+        _interval = min(_interval * 2, MAX_INTERVAL)
+    return _interval
+
+def wake_up_timer(*_args):
+    """Check for tabs soon, when a different text is opened in a Text Editor."""
+    global _interval
+    _interval = MIN_INTERVAL
+    if bpy.app.timers.is_registered(force_spaces_timer):
+        bpy.app.timers.unregister(force_spaces_timer)
+    bpy.app.timers.register(force_spaces_timer, first_interval=0.1, persistent=True)
 
-    return 3
+@persistent
+def subscribe_text_changes(_dummy=None):
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.SpaceTextEditor, "text"),
+        owner=_msgbus_owner,
+        args=(),
+        notify=wake_up_timer,
+    )
 
 def get_addon_prefs(context=None):
     if not context:
@@ -42,9 +134,14 @@ def get_addon_prefs(context=None):
 registry = [MetsToolsPrefs]
 
 def register():
-    bpy.app.timers.register(force_spaces_timer)
+    bpy.app.timers.register(force_spaces_timer, persistent=True)
+    subscribe_text_changes()
+    bpy.app.handlers.load_post.append(subscribe_text_changes)
 
 def unregister():
+    bpy.app.handlers.load_post.remove(subscribe_text_changes)
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    _text_states.clear()
     try:
         bpy.app.timers.unregister(force_spaces_timer)
     except:
@@ -1,12 +1,58 @@
 import bpy
 from bpy.props import BoolProperty
+from time import perf_counter
+from . import utils
 
-def refresh_drivers(datablock):
-	if not datablock: return
-	if not hasattr(datablock, "animation_data"): return
-	if not datablock.animation_data: return
-	for d in datablock.animation_data.drivers:
-		d.driver.type = d.driver.type
+def get_object_datablocks(objects):
+	"""Yield the objects and the datablocks they use that can have drivers, each only once,
+	even when shared between several objects."""
+	seen = set()
+	for o in objects:
+		datablocks = [o]
+		if hasattr(o, "data") and o.data:
+			datablocks.append(o.data)
+		if o.type=='MESH':
+			datablocks.append(o.data.shape_keys)
+		for ms in o.material_slots:
+			if ms.material:
+				datablocks.append(ms.material)
+				datablocks.append(ms.material.node_tree)
+		for datablock in datablocks:
+			if datablock is None or datablock in seen:
+				continue
+			seen.add(datablock)
+			yield datablock
+
+def refresh_datablock_drivers(datablocks):
+	"""Refresh the drivers of each datablock.
+	Return a dictionary of ID type : (number of datablocks, number of drivers, seconds taken)."""
+	stats = {}
+	for datablock in datablocks:
+		if not getattr(datablock, 'animation_data', None):
+			continue
+		start = perf_counter()
+		drivers = datablock.animation_data.drivers
+		for d in drivers:
+			d.driver.type = d.driver.type
+		num_ids, num_drivers, seconds = stats.get(datablock.id_type, (0, 0, 0.0))
+		stats[datablock.id_type] = (
+			num_ids + 1,
+			num_drivers + len(drivers),
+			seconds + perf_counter() - start,
+		)
+	return stats
+
+def get_invalid_drivers(datablocks):
+	"""Return a list of (datablock, driver F-Curve) of invalid drivers.
+	Drivers are only flagged invalid when evaluated, so the depsgraph should be updated first."""
+	invalid = []
+	for datablock in datablocks:
+		if not getattr(datablock, 'animation_data', None):
+			continue
+		for d in datablock.animation_data.drivers:
+			if not d.driver.is_valid or not d.is_valid:
+				invalid.append((datablock, d))
+	return invalid
 
 class RefreshDrivers(bpy.types.Operator):
 	"""Refresh drivers, ensuring no valid drivers are marked as invalid"""
@@ -16,21 +62,35 @@ class RefreshDrivers(bpy.types.Operator):
 	bl_options = {'REGISTER', 'UNDO'}
 
 	selected_only: BoolProperty(name="Only Selected Objects", default=True)
+	all_datablocks: BoolProperty(
+		name="All Datablocks",
+		description="Refresh drivers on every datablock in the file, such as worlds, scenes, node groups, cameras and lights, not only objects and their data",
+		default=False,
+	)
 
 	def execute(self, context):
-		objs = context.selected_objects if self.selected_only else bpy.data.objects
-
-		for o in objs:
-			refresh_drivers(o)
-			if hasattr(o, "data") and o.data:
-				refresh_drivers(o.data)
-			if o.type=='MESH':
-				refresh_drivers(o.data.shape_keys)
-			
-			for ms in o.material_slots:
-				if ms.material:
-					refresh_drivers(ms.material)
-					refresh_drivers(ms.material.node_tree)
+		if self.all_datablocks:
+			datablocks = utils.get_id_datablocks()
+		else:
+			objs = context.selected_objects if self.selected_only else bpy.data.objects
+			datablocks = get_object_datablocks(objs)
+		datablocks = list(datablocks)
+
+		stats = refresh_datablock_drivers(datablocks)
+		# Re-evaluate the drivers, so the ones that are still broken get flagged as invalid again.
+		context.view_layer.update()
+		invalid = get_invalid_drivers(datablocks)
+
+		for id_type, (num_ids, num_drivers, seconds) in sorted(stats.items()):
+			print(f"Refresh Drivers: {id_type}: {num_drivers} drivers on {num_ids} datablocks in {seconds:.4f}s")
+		for datablock, d in invalid:
+			print(f"Refresh Drivers: Invalid driver: {datablock.name}: {d.data_path}[{d.array_index}]")
+
+		num_drivers = sum(s[1] for s in stats.values())
+		if invalid:
+			self.report({'WARNING'}, f"Refreshed {num_drivers} drivers, {len(invalid)} are still invalid. See console for details.")
+		else:
+			self.report({'INFO'}, f"Refreshed {num_drivers} drivers.")
 
 		return { 'FINISHED' }
 
@@ -40,4 +100,4 @@ def register():
 
 def unregister():
 	from bpy.utils import unregister_class
-	unregister_class(RefreshDrivers)
\ No newline at end of file
+	unregister_class(RefreshDrivers)
@@ -1,4 +1,5 @@
 import bpy
+from bpy.props import BoolProperty, FloatProperty, IntProperty
 
 class OBJECT_OT_remove_empty_shape_keys(bpy.types.Operator):
     """Remove empty shape keys and their drivers."""
@@ -7,38 +8,122 @@ class OBJECT_OT_remove_empty_shape_keys(bpy.types.Operator):
     bl_label = "Remove Empty Shape Keys"
     bl_options = {'REGISTER', 'UNDO'}
 
+    epsilon: FloatProperty(
+        name="Epsilon",
+        description="Shape keys whose vertices all move less than this are considered empty",
+        default=1e-6,
+        min=0.0,
+        precision=6,
+    )
+    max_memory_mb: IntProperty(
+        name="Memory Cap (MB)",
+        description="Read all shape keys at once if they fit in this much memory, otherwise read them one by one",
+        default=512,
+        min=1,
+    )
+    report_nearly_empty: BoolProperty(
+        name="Report Nearly Empty",
+        description="List shape keys that move less than the threshold, without deleting them",
+        default=False,
+    )
+    nearly_empty_threshold: FloatProperty(
+        name="Threshold",
+        description="Shape keys whose largest vertex offset is below this are reported as nearly empty",
+        default=1e-3,
+        min=0.0,
+        precision=5,
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.prop(self, 'epsilon')
+        layout.prop(self, 'max_memory_mb')
+        layout.prop(self, 'report_nearly_empty')
+        row = layout.row()
+        row.active = self.report_nearly_empty
+        row.prop(self, 'nearly_empty_threshold')
+
     def execute(self, context):
+        import numpy as np
+        nearly_empty = []
         for obj in context.selected_objects:
             if obj.data and hasattr(obj.data, 'shape_keys') and obj.data.shape_keys:
-                remove_empty_shape_keys(obj)
+                max_deltas = get_shape_key_max_deltas(obj, self.max_memory_mb)
+                if self.report_nearly_empty:
+                    key_blocks = obj.data.shape_keys.key_blocks
+                    for i in np.argsort(max_deltas):
+                        delta = max_deltas[i]
+                        if delta >= self.nearly_empty_threshold:
+                            break
+                        if delta >= self.epsilon:
+                            nearly_empty.append((delta, obj.name, key_blocks[i + 1].name))
+                remove_empty_shape_keys(obj, self.epsilon, max_deltas)
+
+        if nearly_empty:
+            nearly_empty.sort()
+            for delta, obj_name, key_name in nearly_empty:
+                print(f"Nearly empty shape key: {obj_name} -> {key_name} ({delta:.6f})")
+            self.report(
+                {'INFO'},
+                f"{len(nearly_empty)} nearly empty shape keys, smallest: {nearly_empty[0][2]}. See console for the full list.",
+            )
 
         return {'FINISHED'}
 
-def is_shape_key_empty(obj, shape_key, epsilon=1e-6):
-    """Checks if a shape key is identical to the base shape within a small tolerance."""
-    mesh = obj.data
-    base_key = mesh.shape_keys.key_blocks[0]  # Basis shape key
+def get_shape_key_max_deltas(obj, max_memory_mb=512):
+    """Return the largest vertex offset from the basis of every non-basis shape key.
+    Reads all key blocks into one buffer if it fits in max_memory_mb, otherwise one key at a time.
+    """
+    import numpy as np
+    key_blocks = obj.data.shape_keys.key_blocks
+    num_keys = len(key_blocks) - 1
+    # Not obj.data.vertices, so curves and lattices work too.
+    num_verts = len(key_blocks[0].data)
+    max_deltas = np.zeros(num_keys, dtype=np.float32)
+    if num_keys < 1 or num_verts == 0:
+        return max_deltas
+
+    basis = np.empty(num_verts * 3, dtype=np.float32)
+    key_blocks[0].data.foreach_get('co', basis)
+    basis.shape = (num_verts, 3)
 
-    for i, vert in enumerate(mesh.vertices):
-        if not (shape_key.data[i].co - base_key.data[i].co).length < epsilon:
-            return False  # Significant difference found, not empty
-    return True  # All coordinates are nearly identical
+    buffer_size = num_keys * num_verts * 3 * basis.itemsize
+    if buffer_size <= max_memory_mb * 1024 * 1024:
+        coords = np.empty((num_keys, num_verts * 3), dtype=np.float32)
+        for i, key_block in enumerate(key_blocks[1:]):
+            key_block.data.foreach_get('co', coords[i])
+        coords.shape = (num_keys, num_verts, 3)
+        coords -= basis
+        max_deltas[:] = np.sqrt((coords * coords).sum(axis=2).max(axis=1))
+        return max_deltas
 
-def remove_empty_shape_keys(obj):
+    co = np.empty(num_verts * 3, dtype=np.float32)
+    for i, key_block in enumerate(key_blocks[1:]):
+        key_block.data.foreach_get('co', co)
+        delta = co.reshape(num_verts, 3) - basis
+        max_deltas[i] = np.sqrt((delta * delta).sum(axis=1).max())
+    return max_deltas
+
+def remove_empty_shape_keys(obj, epsilon=1e-6, max_deltas=None):
     """Removes all empty shape keys from the given object."""
     if obj.data.shape_keys:
         shape_keys = obj.data.shape_keys.key_blocks
         animdata = obj.data.shape_keys.animation_data
-        drivers = animdata.drivers
-        keys_to_remove = [key.name for key in shape_keys[1:] if is_shape_key_empty(obj, key)]
-        
+        drivers = animdata.drivers if animdata else None
+        if max_deltas is None:
+            max_deltas = get_shape_key_max_deltas(obj)
+        keys_to_remove = [
+            key.name for key, delta in zip(shape_keys[1:], max_deltas) if delta < epsilon
+        ]
+
         for key_name in keys_to_remove:
             if drivers:
                 drv = drivers.find(f'key_blocks["{key_name}"].value')
                 if drv:
                     drivers.remove(drv)
             obj.shape_key_remove(shape_keys[key_name])
-        
+
         if keys_to_remove:
             print(f"Removed {len(keys_to_remove)} empty shape keys from {obj.name}.")
         else:
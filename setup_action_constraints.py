@@ -1,15 +1,160 @@
+import re
 from . import utils
+import bpy
 from bpy.props import (
     EnumProperty,
     IntProperty,
     FloatProperty,
     BoolProperty,
     StringProperty,
+    PointerProperty,
+    CollectionProperty,
 )
 from bpy.types import VIEW3D_MT_pose_constraints
-from bpy.types import PoseBone, Action, ActionSlot, Operator
+from bpy.types import PoseBone, Action, ActionSlot, Operator, PropertyGroup, UIList
 from bpy_extras import anim_utils
-from bpy.utils import flip_name, register_class, unregister_class
+from bpy.utils import flip_name, register_class, unregister_class, unescape_identifier
+from bpy.app.handlers import persistent
+
+# Matches the bone name in an F-Curve data path like 'pose.bones["Bone"].location'.
+BONE_PATH_RE = re.compile(r'pose\.bones\["((?:[^"\\]|\\.)*)"\]')
+
+# (Action pointer, slot handle) : (number of F-Curves, dict of keyed bone names, in F-Curve order)
+_keyed_bones_cache = {}
+_msgbus_owner = object()
+
+
+@persistent
+def invalidate_keyed_bones_cache(*_args):
+    _keyed_bones_cache.clear()
+
+
+@persistent
+def invalidate_updated_actions(scene, depsgraph):
+    """Drop the cached keyed bones of Actions that were changed, eg. by renaming a bone."""
+    if not _keyed_bones_cache:
+        return
+    pointers = {
+        update.id.original.as_pointer()
+        for update in depsgraph.updates
+        if isinstance(update.id, Action)
+    }
+    for key in list(_keyed_bones_cache):
+        if key[0] in pointers:
+            del _keyed_bones_cache[key]
+
+
+def read_keyed_bone_names(fcurves) -> dict[str, None]:
+    bone_names = {}
+    for fc in fcurves:
+        match = BONE_PATH_RE.match(fc.data_path)
+        if match:
+            bone_names[unescape_identifier(match.group(1))] = None
+    return bone_names
+
+
+def get_keyed_bone_names(action: Action, slot: ActionSlot, use_cache=False) -> dict[str, None]:
+    """Return the names of bones keyed in an Action slot, in F-Curve order.
+    use_cache: Reuse the result of an earlier call, unless the number of F-Curves changed
+    or the Action was updated since. Only for display, since callers that remove
+    constraints based on the result must read the F-Curves.
+    """
+    if not action:
+        return {}
+    channelbag = anim_utils.action_get_channelbag_for_slot(action, slot)
+    if not channelbag:
+        return {}
+    fcurves = channelbag.fcurves
+    key = (action.as_pointer(), slot.handle if slot else None)
+    if use_cache:
+        cached = _keyed_bones_cache.get(key)
+        if cached and cached[0] == len(fcurves):
+            return cached[1]
+
+    bone_names = read_keyed_bone_names(fcurves)
+    _keyed_bones_cache[key] = (len(fcurves), bone_names)
+    return bone_names
+
+
+@persistent
+def subscribe_fcurve_changes(_dummy=None):
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.FCurve, "data_path"),
+        owner=_msgbus_owner,
+        args=(),
+        notify=invalidate_keyed_bones_cache,
+    )
+
+
+TRANSFORM_CHANNEL_ITEMS = [
+    ("LOCATION_X", "X Location", "X Location"),
+    ("LOCATION_Y", "Y Location", "Y Location"),
+    ("LOCATION_Z", "Z Location", "Z Location"),
+    ("ROTATION_X", "X Rotation", "X Rotation"),
+    ("ROTATION_Y", "Y Rotation", "Y Rotation"),
+    ("ROTATION_Z", "Z Rotation", "Z Rotation"),
+    ("SCALE_X", "X Scale", "X Scale"),
+    ("SCALE_Y", "Y Scale", "Y Scale"),
+    ("SCALE_Z", "Z Scale", "Z Scale"),
+]
+
+TARGET_SPACE_ITEMS = [
+    ("WORLD", "World Space", "World Space"),
+    ("POSE", "Pose Space", "Pose Space"),
+    ("LOCAL_WITH_PARENT", "Local With Parent", "Local With Parent"),
+    ("LOCAL", "Local Space", "Local Space"),
+]
+
+CON_PREFIX = "Action_"
+
+
+def get_constraint_names(action: Action) -> tuple[str, str, str]:
+    """Return the names of the unsided, left and right Action constraints of an Action."""
+    name = CON_PREFIX + action.name
+    return name, name + ".L", name + ".R"
+
+
+def configure_action_constraint(
+    con, pbone: PoseBone, rig_ob, action: Action, slot: ActionSlot | None, settings
+):
+    """Apply Action constraint settings to a constraint.
+    settings: Anything with the subtarget, target_space, transform_channel, trans_min,
+    trans_max, frame_start, frame_end and enabled attributes, such as the operator itself.
+    """
+    # TODO: Utils should have a way to detect and set a string to a specific side, rather than only flip. That way we wouldn't have to hard-code and only support .L/.R suffix.
+    # This is done in CloudRig, take the code from there.
+    # TODO: We should abstract constraints just like we did drivers in .definitions, and then let those abstract constraints mirror themselves. Then we can use that mirroring functionality from both here and X Mirror Constraints operator.
+    subtarget = settings.subtarget
+
+    # If bone name indicates a side, force subtarget to that side, if subtarget is flippable.
+    if pbone.name.endswith(".L") and subtarget.endswith(".R"):
+        if flip_name(subtarget) != subtarget:
+            subtarget = subtarget[:-2] + ".L"
+    if pbone.name.endswith(".R") and subtarget.endswith(".L"):
+        if flip_name(subtarget) != subtarget:
+            subtarget = subtarget[:-2] + ".R"
+
+    # If constraint name indicates a side, force subtarget to that side and set influence to 0.5.
+    if con.name.endswith(".L") and subtarget.endswith(".R"):
+        subtarget = subtarget[:-2] + ".L"
+        con.influence = 0.5
+    if con.name.endswith(".R") and subtarget.endswith(".L"):
+        subtarget = subtarget[:-2] + ".R"
+        con.influence = 0.5
+
+    con.target_space = settings.target_space
+    con.transform_channel = settings.transform_channel
+    con.target = rig_ob
+    if subtarget != "":
+        con.subtarget = subtarget
+    con.action = action
+    if slot:
+        con.action_slot = slot
+    con.min = settings.trans_min
+    con.max = settings.trans_max
+    con.frame_start = settings.frame_start
+    con.frame_end = settings.frame_end
+    con.mute = not settings.enabled
 
 
 class OBJECT_OT_setup_action_constraints(Operator):
@@ -21,29 +166,14 @@ class OBJECT_OT_setup_action_constraints(Operator):
 
     transform_channel: EnumProperty(
         name="Transform Channel",
-        items=[
-            ("LOCATION_X", "X Location", "X Location"),
-            ("LOCATION_Y", "Y Location", "Y Location"),
-            ("LOCATION_Z", "Z Location", "Z Location"),
-            ("ROTATION_X", "X Rotation", "X Rotation"),
-            ("ROTATION_Y", "Y Rotation", "Y Rotation"),
-            ("ROTATION_Z", "Z Rotation", "Z Rotation"),
-            ("SCALE_X", "X Scale", "X Scale"),
-            ("SCALE_Y", "Y Scale", "Y Scale"),
-            ("SCALE_Z", "Z Scale", "Z Scale"),
-        ],
+        items=TRANSFORM_CHANNEL_ITEMS,
         description="Transform channel",
         default="LOCATION_X",
     )
 
     target_space: EnumProperty(
         name="Transform Space",
-        items=[
-            ("WORLD", "World Space", "World Space"),
-            ("POSE", "Pose Space", "Pose Space"),
-            ("LOCAL_WITH_PARENT", "Local With Parent", "Local With Parent"),
-            ("LOCAL", "Local Space", "Local Space"),
-        ],
+        items=TARGET_SPACE_ITEMS,
         default="LOCAL",
     )
 
@@ -137,7 +267,7 @@ class OBJECT_OT_setup_action_constraints(Operator):
 
     def draw(self, context):
         layout = self.layout
-        affected_bones = self.get_keyed_bones(context)
+        affected_bones = self.get_keyed_bones(context, use_cache=True)
         box = layout.box()
         header, panel = box.panel("Setup Action: Operation Config")
         header.label(text="Operation")
@@ -193,34 +323,22 @@ class OBJECT_OT_setup_action_constraints(Operator):
         trans_row2.prop(self, "trans_min")
         trans_row2.prop(self, "trans_max")
 
-    def get_all_bones(self, context) -> list[PoseBone]:
+    def get_all_bones(self, context) -> set[str]:
         rig_ob = context.active_object
         if self.affect == "ALL":
-            return [b.name for b in rig_ob.pose.bones]
+            return {b.name for b in rig_ob.pose.bones}
         else:
-            return [b.name for b in context.selected_pose_bones]
+            return {b.name for b in context.selected_pose_bones}
 
-    def get_keyed_bones(self, context) -> list[PoseBone]:
+    def get_keyed_bones(self, context, use_cache=False) -> list[PoseBone]:
         rig_ob = context.active_object
-        action = rig_ob.animation_data.action
-        all_bones = self.get_all_bones(context)
-        bones = []
         action, slot = self.get_active_action(context)
-        channelbag = anim_utils.action_get_channelbag_for_slot(action, slot)
-        if not channelbag:
-            return []
-        for fc in channelbag.fcurves:
-            # Extracting bone name from fcurve data path
-            if "pose.bones" in fc.data_path:
-                bone_name = fc.data_path.split('["')[1].split('"]')[0]
-
-                if bone_name not in all_bones:
-                    continue
-
-                bone = rig_ob.pose.bones.get(bone_name)
-                if bone and bone not in bones:
-                    bones.append(bone)
-        return bones
+        bone_names = get_keyed_bone_names(action, slot, use_cache)
+        if self.affect == "SELECTED":
+            selected = {b.name for b in context.selected_pose_bones or []}
+            bone_names = [name for name in bone_names if name in selected]
+        bones = [rig_ob.pose.bones.get(name) for name in bone_names]
+        return [bone for bone in bones if bone]
 
     def execute(self, context):
         rig_ob = context.active_object
@@ -228,20 +346,14 @@ class OBJECT_OT_setup_action_constraints(Operator):
         if not action:
             self.report({"ERROR"}, "No Action was selected.")
             return {"CANCELLED"}
-        CON_PREFIX = "Action_"
-        constraint_name = CON_PREFIX + action.name
-        constraint_name_left = CON_PREFIX + action.name + ".L"
-        constraint_name_right = CON_PREFIX + action.name + ".R"
-        constraint_names = [
-            constraint_name,
-            constraint_name_left,
-            constraint_name_right,
-        ]
+        constraint_names = get_constraint_names(action)
+        constraint_name, constraint_name_left, constraint_name_right = constraint_names
 
         all_bones = self.get_all_bones(context)
 
         # Getting a list of pose bones on the active armature corresponding to the selected action's keyframes
         pbones = self.get_keyed_bones(context)
+        keyed_bone_names = {pbone.name for pbone in pbones}
 
         # Adding or updating Action constraint on the bones
         for pbone in pbones:
@@ -273,37 +385,7 @@ class OBJECT_OT_setup_action_constraints(Operator):
 
             # Configuring Action constraints
             for con in constraints:
-                # TODO: Utils should have a way to detect and set a string to a specific side, rather than only flip. That way we wouldn't have to hard-code and only support .L/.R suffix.
-                # This is done in CloudRig, take the code from there.
-                # TODO: We should abstract constraints just like we did drivers in .definitions, and then let those abstract constraints mirror themselves. Then we can use that mirroring functionality from both here and X Mirror Constraints operator.
-
-                # If bone name indicates a side, force subtarget to that side, if subtarget is flippable.
-                if pbone.name.endswith(".L") and self.subtarget.endswith(".R"):
-                    if flip_name(self.subtarget) != self.subtarget:
-                        self.subtarget = self.subtarget[:-2] + ".L"
-                if pbone.name.endswith(".R") and self.subtarget.endswith(".L"):
-                    if flip_name(self.subtarget) != self.subtarget:
-                        self.subtarget = self.subtarget[:-2] + ".R"
-
-                # If constraint name indicates a side, force subtarget to that side and set influence to 0.5.
-                if con.name.endswith(".L") and self.subtarget.endswith(".R"):
-                    self.subtarget = self.subtarget[:-2] + ".L"
-                    con.influence = 0.5
-                if con.name.endswith(".R") and self.subtarget.endswith(".L"):
-                    self.subtarget = self.subtarget[:-2] + ".R"
-                    con.influence = 0.5
-
-                con.target_space = self.target_space
-                con.transform_channel = self.transform_channel
-                con.target = rig_ob
-                if self.subtarget != "":
-                    con.subtarget = self.subtarget
-                con.action = action
-                con.min = self.trans_min
-                con.max = self.trans_max
-                con.frame_start = self.frame_start
-                con.frame_end = self.frame_end
-                con.mute = not self.enabled
+                configure_action_constraint(con, pbone, rig_ob, action, None, self)
 
         # Deleting superfluous action constraints, if any
         for bn in all_bones:
@@ -319,7 +401,7 @@ class OBJECT_OT_setup_action_constraints(Operator):
                             pbone.constraints.remove(con)
                             continue
                         # If the name is fine, but there is no associated keyframe
-                        elif pbone not in pbones:
+                        elif pbone.name not in keyed_bone_names:
                             pbone.constraints.remove(con)
                             continue
 
@@ -328,15 +410,302 @@ class OBJECT_OT_setup_action_constraints(Operator):
         return {"FINISHED"}
 
 
+class ActionConstraintSetup(PropertyGroup):
+    """Action constraint settings of one Action, for batch setup."""
+
+    action: PointerProperty(name="Action", type=Action)
+    slot_identifier: StringProperty(
+        name="Slot",
+        description="Identifier of the Action Slot to use. If empty, the Action's first slot is used",
+    )
+    subtarget: StringProperty(name="Control Bone")
+    transform_channel: EnumProperty(
+        name="Transform Channel",
+        items=TRANSFORM_CHANNEL_ITEMS,
+        default="LOCATION_X",
+    )
+    target_space: EnumProperty(
+        name="Transform Space",
+        items=TARGET_SPACE_ITEMS,
+        default="LOCAL",
+    )
+    frame_start: IntProperty(name="Start Frame")
+    frame_end: IntProperty(name="End Frame", default=2)
+    trans_min: FloatProperty(name="Min", default=-0.05)
+    trans_max: FloatProperty(name="Max", default=0.05)
+    enabled: BoolProperty(name="Enabled", default=True)
+
+    def get_slot(self) -> ActionSlot | None:
+        if not self.action or not self.action.slots:
+            return None
+        if not self.slot_identifier:
+            return self.action.slots[0]
+        for slot in self.action.slots:
+            if slot.identifier == self.slot_identifier:
+                return slot
+
+
+class ARMATURE_UL_action_constraint_setups(UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
+        row = layout.row(align=True)
+        row.prop(item, "enabled", text="")
+        row.prop(item, "action", text="", emboss=False)
+        row.label(text=item.subtarget)
+
+
+class OBJECT_OT_action_constraint_setup_add(Operator):
+    """Add the active Action to the list of Actions to set up in batch"""
+
+    bl_idname = "armature.action_constraint_setup_add"
+    bl_label = "Add Action Setup"
+    bl_options = {"REGISTER", "UNDO", "INTERNAL"}
+
+    def execute(self, context):
+        rig_ob = context.active_object
+        setup = rig_ob.action_constraint_setups.add()
+        animdata = rig_ob.animation_data
+        if animdata and animdata.action:
+            setup.action = animdata.action
+            if animdata.action_slot:
+                setup.slot_identifier = animdata.action_slot.identifier
+        if context.active_pose_bone:
+            setup.subtarget = context.active_pose_bone.name
+        rig_ob.action_constraint_setups_active_index = (
+            len(rig_ob.action_constraint_setups) - 1
+        )
+        return {"FINISHED"}
+
+
+class OBJECT_OT_action_constraint_setup_remove(Operator):
+    """Remove the active entry from the list of Actions to set up in batch"""
+
+    bl_idname = "armature.action_constraint_setup_remove"
+    bl_label = "Remove Action Setup"
+    bl_options = {"REGISTER", "UNDO", "INTERNAL"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object and context.active_object.action_constraint_setups
+
+    def execute(self, context):
+        rig_ob = context.active_object
+        index = rig_ob.action_constraint_setups_active_index
+        rig_ob.action_constraint_setups.remove(index)
+        rig_ob.action_constraint_setups_active_index = max(0, index - 1)
+        return {"FINISHED"}
+
+
+class OBJECT_OT_setup_action_constraints_batch(Operator):
+    """Manage Action constraints of all Actions in the armature's Action setup list at once"""
+
+    bl_idname = "armature.setup_action_constraints_batch"
+    bl_label = "Setup Action Constraints (Batch)"
+    bl_options = {"REGISTER", "UNDO"}
+
+    mode: EnumProperty(
+        name="Mode",
+        items=[
+            (
+                "DELETE",
+                "Delete",
+                "Delete Action constraints of all listed Actions.",
+            ),
+            (
+                "ENSURE",
+                "Ensure",
+                "Create/Update Action constraints of all listed Actions. Remove constraints of bones which are not keyed in their Action's slot.",
+            ),
+        ],
+        default="ENSURE",
+    )
+
+    affect: EnumProperty(
+        name="Affect Bones",
+        items=(
+            ("SELECTED", "Selected", "Affect all selected bones"),
+            ("ALL", "All", "Affect all bones in the active armature"),
+        ),
+        default="ALL",
+    )
+
+    @classmethod
+    def poll(cls, context):
+        return OBJECT_OT_setup_action_constraints.poll(context)
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self, width=400)
+
+    def draw(self, context):
+        layout = self.layout
+        rig_ob = context.active_object
+
+        row = layout.row()
+        row.template_list(
+            "ARMATURE_UL_action_constraint_setups",
+            "",
+            rig_ob,
+            "action_constraint_setups",
+            rig_ob,
+            "action_constraint_setups_active_index",
+        )
+        col = row.column(align=True)
+        col.operator(OBJECT_OT_action_constraint_setup_add.bl_idname, text="", icon="ADD")
+        col.operator(
+            OBJECT_OT_action_constraint_setup_remove.bl_idname, text="", icon="REMOVE"
+        )
+
+        setups = rig_ob.action_constraint_setups
+        index = rig_ob.action_constraint_setups_active_index
+        if 0 <= index < len(setups):
+            setup = setups[index]
+            box = layout.box()
+            box.prop(setup, "action")
+            if setup.action:
+                box.prop_search(setup, "slot_identifier", setup.action, "slots")
+            box.prop_search(setup, "subtarget", rig_ob.data, "bones")
+            frame_row = box.row(align=True)
+            frame_row.prop(setup, "frame_start", text="Start")
+            frame_row.prop(setup, "frame_end", text="End")
+            trans_row = box.row(align=True)
+            trans_row.prop(setup, "target_space", text="")
+            trans_row.prop(setup, "transform_channel", text="")
+            trans_row2 = box.row(align=True)
+            trans_row2.prop(setup, "trans_min")
+            trans_row2.prop(setup, "trans_max")
+
+        layout.row().prop(self, "affect", expand=True)
+        layout.row().prop(self, "mode", expand=True)
+
+    def execute(self, context):
+        rig_ob = context.active_object
+        setups = [s for s in rig_ob.action_constraint_setups if s.action]
+        if not setups:
+            self.report({"ERROR"}, "No Actions in the Action setup list.")
+            return {"CANCELLED"}
+
+        if self.affect == "ALL":
+            affected = {b.name for b in rig_ob.pose.bones}
+        else:
+            affected = {b.name for b in context.selected_pose_bones or []}
+
+        # One pass over the rig: (bone name, action) : list of its Action constraints.
+        actions = {setup.action for setup in setups}
+        existing = {}
+        for pbone in rig_ob.pose.bones:
+            if pbone.name not in affected:
+                continue
+            for con in pbone.constraints:
+                if con.type == "ACTION" and con.action in actions:
+                    existing.setdefault((pbone.name, con.action), []).append(con)
+
+        summary = []
+        for setup in setups:
+            action = setup.action
+            slot = setup.get_slot()
+            constraint_names = get_constraint_names(action)
+            keyed = set()
+            if self.mode == "ENSURE":
+                keyed = {
+                    name
+                    for name in get_keyed_bone_names(action, slot)
+                    if name in affected
+                }
+            created = updated = removed = 0
+
+            # Deleting superfluous action constraints, if any
+            for (bone_name, con_action), cons in existing.items():
+                if con_action != action:
+                    continue
+                pbone = rig_ob.pose.bones[bone_name]
+                for con in cons[:]:
+                    if (
+                        bone_name not in keyed
+                        or con.name not in constraint_names
+                        or (slot and con.action_slot and con.action_slot != slot)
+                    ):
+                        pbone.constraints.remove(con)
+                        cons.remove(con)
+                        removed += 1
+
+            # Adding or updating Action constraints on the keyed bones
+            for bone_name in keyed:
+                pbone = rig_ob.pose.bones[bone_name]
+                constraints = existing.get((bone_name, action), [])
+                if not constraints:
+                    if (
+                        flip_name(pbone.name) == pbone.name
+                        and flip_name(setup.subtarget) != setup.subtarget
+                    ):
+                        # If bone name is unflippable, but target bone name is flippable, split constraint in two.
+                        names = constraint_names[1:]
+                    else:
+                        names = constraint_names[:1]
+                    for name in names:
+                        con = pbone.constraints.new(type="ACTION")
+                        con.name = name
+                        constraints.append(con)
+                    created += len(names)
+                else:
+                    updated += len(constraints)
+                for con in constraints:
+                    configure_action_constraint(con, pbone, rig_ob, action, slot, setup)
+
+            summary.append((action.name, created, updated, removed))
+
+        for action_name, created, updated, removed in summary:
+            print(
+                f"Setup Action Constraints: {action_name}: {created} created, {updated} updated, {removed} removed."
+            )
+        totals = [sum(row[i] for row in summary) for i in (1, 2, 3)]
+        self.report(
+            {"INFO"},
+            f"{len(summary)} Actions: {totals[0]} constraints created, {totals[1]} updated, {totals[2]} removed. See console for details.",
+        )
+        return {"FINISHED"}
+
+
 def draw_button(self, context):
     self.layout.operator(OBJECT_OT_setup_action_constraints.bl_idname, icon="ACTION")
+    self.layout.operator(
+        OBJECT_OT_setup_action_constraints_batch.bl_idname, icon="ACTION"
+    )
+
+
+classes = [
+    OBJECT_OT_setup_action_constraints,
+    ActionConstraintSetup,
+    ARMATURE_UL_action_constraint_setups,
+    OBJECT_OT_action_constraint_setup_add,
+    OBJECT_OT_action_constraint_setup_remove,
+    OBJECT_OT_setup_action_constraints_batch,
+]
 
 
 def register():
-    register_class(OBJECT_OT_setup_action_constraints)
+    # Not a `registry` list, since the Object properties have to be removed
+    # before their PropertyGroup is unregistered, and `registry` classes are
+    # unregistered before unregister() is called.
+    for cls in classes:
+        register_class(cls)
+    bpy.types.Object.action_constraint_setups = CollectionProperty(
+        type=ActionConstraintSetup
+    )
+    bpy.types.Object.action_constraint_setups_active_index = IntProperty()
     VIEW3D_MT_pose_constraints.append(draw_button)
+    subscribe_fcurve_changes()
+    bpy.app.handlers.load_post.append(subscribe_fcurve_changes)
+    bpy.app.handlers.load_post.append(invalidate_keyed_bones_cache)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_updated_actions)
 
 
 def unregister():
-    unregister_class(OBJECT_OT_setup_action_constraints)
+    bpy.app.handlers.load_post.remove(subscribe_fcurve_changes)
+    bpy.app.handlers.load_post.remove(invalidate_keyed_bones_cache)
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_updated_actions)
+    bpy.msgbus.clear_by_owner(_msgbus_owner)
+    invalidate_keyed_bones_cache()
     VIEW3D_MT_pose_constraints.remove(draw_button)
+    del bpy.types.Object.action_constraint_setups
+    del bpy.types.Object.action_constraint_setups_active_index
+    for cls in reversed(classes):
+        unregister_class(cls)
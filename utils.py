@@ -1,5 +1,11 @@
 import bpy
+import re
+from bisect import bisect_left, bisect_right
+from fnmatch import translate
+from functools import lru_cache
 from typing import List
+from bpy.app.handlers import persistent
+from mathutils import kdtree
 
 def find_invalid_constraints(context, hidden_is_invalid=False):
 	# If hidden=True, disabled constraints are considered invalid.
@@ -69,102 +75,393 @@ def find_or_create_constraint(pb, con_type, name=None):
 		con.name = name
 	return con
 
-def bone_search(armature, search=None, start=None, end=None, edit_bone=False, must_be_selected=True) -> List[bpy.types.Bone or bpy.types.EditBone]:
+class BoneNameIndex:
+	"""Sorted bone names of an armature, for prefix and suffix lookups by binary search.
+	Use get_bone_name_index() to get one that is cached per armature.
+	"""
+
+	def __init__(self, bones):
+		self.count = len(bones)
+		# Names in armature order, to return matches in that order.
+		self.ordered_names = [b.name for b in bones]
+		self.positions = {name: i for i, name in enumerate(self.ordered_names)}
+		self.names = sorted(self.ordered_names)
+		# Sorting the reversed names turns a suffix search into a prefix search.
+		self.reversed_names = sorted(name[::-1] for name in self.names)
+
+	@staticmethod
+	def _prefix_range(sorted_names, prefix):
+		lo = bisect_left(sorted_names, prefix)
+		hi = bisect_right(sorted_names, prefix + chr(0x10FFFF), lo=lo)
+		return sorted_names[lo:hi]
+
+	def with_prefix(self, prefix) -> List[str]:
+		return self._prefix_range(self.names, prefix)
+
+	def with_suffix(self, suffix) -> List[str]:
+		return [name[::-1] for name in self._prefix_range(self.reversed_names, suffix[::-1])]
+
+	def in_armature_order(self, names) -> List[str]:
+		return sorted(names, key=self.positions.__getitem__)
+
+# (Armature Object pointer, edit_bone) : BoneNameIndex
+_bone_name_indices = {}
+_msgbus_owner = object()
+
+@persistent
+def invalidate_bone_name_indices(*_args):
+	_bone_name_indices.clear()
+
+def get_bone_name_index(armature, edit_bone=False, rebuild=False) -> BoneNameIndex:
+	"""Return a cached BoneNameIndex of the armature's pose bones or edit bones.
+	The cache is cleared whenever a bone is renamed through the UI or Python, and rebuilt when the bone count changes.
+	That notification is delayed, so bone_search() also rebuilds it when a name it found no longer exists.
+	"""
+	bones = armature.data.edit_bones if edit_bone else armature.pose.bones
+	key = (armature.as_pointer(), edit_bone)
+	index = _bone_name_indices.get(key)
+	if rebuild or not index or index.count != len(bones):
+		index = _bone_name_indices[key] = BoneNameIndex(bones)
+	return index
+
+@lru_cache(maxsize=256)
+def compile_bone_pattern(regex=None, glob=None):
+	if glob is not None:
+		return re.compile(translate(glob))
+	return re.compile(regex)
+
+def glob_literal_prefix(glob) -> str:
+	"""Return the part of a glob pattern before its first wildcard."""
+	match = re.match(r"[^*?\[]*", glob)
+	return match.group(0)
+
+def bone_search(armature, search=None, start=None, end=None, regex=None, glob=None, edit_bone=False, must_be_selected=True) -> List[bpy.types.PoseBone or bpy.types.EditBone]:
 	"""Return a list of bones that match a search criteria.
-	"search", "start" and "end" params are mutually exclusive, only first one passed will be used.
+	search: Substring that must be in the bone name.
+	start, end: Prefix and suffix of the bone name.
+	regex: Regular expression that must match from the start of the bone name.
+	glob: Shell-style wildcard pattern that must match the whole bone name.
+	All passed criteria must match. Bones are returned in armature order.
 	"""
-	bone_list = []
+	assert any(arg is not None for arg in (search, start, end, regex, glob)), "Nothing passed."
+
+	bone_list = armature.data.edit_bones if edit_bone else armature.pose.bones
+	index = get_bone_name_index(armature, edit_bone)
+	names = index.in_armature_order(search_bone_names(index, search, start, end, regex, glob))
+	bones = [bone_list.get(name) for name in names]
+	if None in bones:
+		# A bone was renamed since the index was built, and the rename notification hasn't arrived yet.
+		index = get_bone_name_index(armature, edit_bone, rebuild=True)
+		names = index.in_armature_order(search_bone_names(index, search, start, end, regex, glob))
+		bones = [bone_list[name] for name in names]
+
+	if not must_be_selected:
+		return bones
 	if edit_bone:
-		bone_list = armature.data.edit_bones
+		return [b for b in bones if b.select]
+	return [b for b in bones if b.bone.select]
+
+def search_bone_names(index, search=None, start=None, end=None, regex=None, glob=None) -> List[str]:
+	"""Return the names in a BoneNameIndex that match all passed criteria of bone_search()."""
+	# Narrow down the candidates with binary searches where the criteria allow it.
+	if start is None and glob:
+		start = glob_literal_prefix(glob) or None
+	if start is not None:
+		names = index.with_prefix(start)
+		if end is not None:
+			names = [name for name in names if name.endswith(end)]
+	elif end is not None:
+		names = index.with_suffix(end)
 	else:
-		bone_list = armature.pose.bones
-	
-	matching_bones = []
-	if search:
-		for b in bone_list:
-			if search in b.name:
-				if must_be_selected:
-					if edit_bone:
-						if b.select:
-							matching_bones.append(b)
-					else:
-						if b.bone.select:
-							matching_bones.append(b)
-				else:
-					matching_bones.append(b)
-	elif start:
-		for b in matching_bones:
-			if not b.name.startswith(start):
-				matching_bones.remove(b)
-	elif end:
-		for b in matching_bones:
-			if not b.name.endswith(end):
-				matching_bones.remove(b)
+		names = index.ordered_names
+
+	if search is not None:
+		names = [name for name in names if search in name]
+	if glob is not None:
+		pattern = compile_bone_pattern(glob=glob)
+		names = [name for name in names if pattern.match(name)]
+	if regex is not None:
+		pattern = compile_bone_pattern(regex=regex)
+		names = [name for name in names if pattern.match(name)]
+	return names
+
+@persistent
+def subscribe_bone_renames(_dummy=None):
+	for bone_type in (bpy.types.Bone, bpy.types.EditBone):
+		bpy.msgbus.subscribe_rna(
+			key=(bone_type, "name"),
+			owner=_msgbus_owner,
+			args=(),
+			notify=invalidate_bone_name_indices,
+		)
+
+class EditBoneIndex:
+	"""KD-tree over the heads and tails of an armature's edit bones, for fast proximity queries.
+	Use get_edit_bone_index() to get one that is up to date with the current bone positions.
+	"""
+
+	def __init__(self, armature):
+		self.armature = armature
+		self.num_bones = 0
+		self.key = None
+		self.kd = None
+		self.rebuild()
+
+	def get_key(self):
+		"""Return a value that changes whenever bones are added, removed or moved.
+		Renames don't matter, since hits are resolved by bone index.
+		"""
+		import numpy as np
+		edit_bones = self.armature.data.edit_bones
+		coords = np.empty(len(edit_bones) * 6, dtype=np.float32)
+		num = len(edit_bones) * 3
+		edit_bones.foreach_get('head', coords[:num])
+		edit_bones.foreach_get('tail', coords[num:])
+		return (len(edit_bones), hash(coords.tobytes()))
+
+	def is_outdated(self):
+		return self.get_key() != self.key
+
+	def rebuild(self):
+		edit_bones = self.armature.data.edit_bones
+		self.num_bones = len(edit_bones)
+		self.kd = kdtree.KDTree(self.num_bones * 2)
+		for i, eb in enumerate(edit_bones):
+			# Heads are stored at the bone's index, tails offset by the number of bones.
+			self.kd.insert(eb.head, i)
+			self.kd.insert(eb.tail, self.num_bones + i)
+		self.kd.balance()
+		self.key = self.get_key()
+
+	def _hit_bone_indices(self, hits, heads, tails):
+		ret = []
+		seen = set()
+		for _co, index, _dist in hits:
+			is_tail = index >= self.num_bones
+			if (is_tail and not tails) or (not is_tail and not heads):
+				continue
+			bone_index = index % self.num_bones
+			if bone_index not in seen:
+				seen.add(bone_index)
+				ret.append(bone_index)
+		return ret
+
+	def _to_bones(self, bone_indices):
+		edit_bones = self.armature.data.edit_bones
+		return [edit_bones[i] for i in bone_indices]
+
+	def find_range(self, co, dist, heads=True, tails=False) -> List[bpy.types.EditBone]:
+		"""Return bones whose head and/or tail is within dist of co, closest first."""
+		hits = sorted(self.kd.find_range(co, dist), key=lambda hit: hit[2])
+		return self._to_bones(self._hit_bone_indices(hits, heads, tails))
+
+	def find_range_batch(self, coords, dist, heads=True, tails=False) -> List[List[bpy.types.EditBone]]:
+		"""Return a list of nearby bones for each coordinate."""
+		return [self.find_range(co, dist, heads, tails) for co in coords]
+
+	def find_nearest(self, co, count=1, heads=True, tails=False) -> List[bpy.types.EditBone]:
+		"""Return up to `count` bones whose head and/or tail is closest to co, closest first."""
+		num_points = self.num_bones * 2
+		# A bone's head and tail may both be among the nearest points, and points of the
+		# excluded kind take up slots too, so widen the search until enough bones are found.
+		n = count * 2
+		while True:
+			n = min(n, num_points)
+			bone_indices = self._hit_bone_indices(self.kd.find_n(co, n), heads, tails)
+			if len(bone_indices) >= count or n == num_points:
+				return self._to_bones(bone_indices[:count])
+			n *= 2
+
+# Armature Object pointer : EditBoneIndex
+_edit_bone_indices = {}
+
+@persistent
+def invalidate_edit_bone_indices(*_args):
+	"""Drop all cached EditBoneIndex objects. Edit bones are re-created whenever an armature leaves edit mode."""
+	_edit_bone_indices.clear()
+
+def get_edit_bone_index(armature) -> EditBoneIndex:
+	"""Return a cached EditBoneIndex of the armature, rebuilt only if bones changed since the last call."""
+	assert armature.mode=='EDIT'
+	index = _edit_bone_indices.get(armature.as_pointer())
+	if not index:
+		index = _edit_bone_indices[armature.as_pointer()] = EditBoneIndex(armature)
 	else:
-		assert False, "Nothing passed."
-	
-	return matching_bones
+		index.armature = armature
+		if index.is_outdated():
+			index.rebuild()
+	return index
+
+@persistent
+def subscribe_mode_changes(_dummy=None):
+	bpy.msgbus.subscribe_rna(
+		key=(bpy.types.Object, "mode"),
+		owner=_msgbus_owner,
+		args=(),
+		notify=invalidate_edit_bone_indices,
+	)
 
 def find_nearby_edit_bones(armature, search_co, dist=0.0005, search_bones=None) -> List[bpy.types.EditBone]:
 	"""
-	Bruteforce search for bones that are within a given distance of the given coordinates.
-	ebones: Only search in these bones.
+	Search for bones whose head is within a given distance of the given coordinates.
+	search_bones: Only search in these bones.
 	"""
 
 	assert armature.mode=='EDIT'
-	ret = []
-	if not search_bones:
-		search_bones = armature.data.edit_bones
-	
-	for eb in search_bones:
-		if( (eb.head - search_co).length < dist):
-			ret.append(eb)
+	ret = get_edit_bone_index(armature).find_range(search_co, dist)
+	ret = [eb for eb in ret if (eb.head - search_co).length < dist]
+	if search_bones:
+		names = {eb.name for eb in search_bones}
+		ret = [eb for eb in ret if eb.name in names]
 	return ret
 
 
-def copy_attributes(from_thing, to_thing, skip=[""], recursive=False):
+# Properties that copy_attributes() never copies.
+COPY_SKIP = {'rna_type', 'active', 'bl_rna', 'error_location', 'error_rotation'}
+
+# RNA property type : NumPy dtype of the buffer used to copy it with foreach_get/foreach_set.
+FOREACH_DTYPES = {'FLOAT': 'float32', 'INT': 'int32', 'BOOLEAN': bool}
+
+class RNASchema:
+	"""The properties of an RNA type that copy_attributes() cares about, computed once per type."""
+
+	def __init__(self, bl_rna):
+		# (identifier, RNA property type, flat array length) of writable values.
+		self.writable = []
+		# Identifiers of collection properties, to be copied recursively.
+		self.collections = []
+		for prop in bl_rna.properties:
+			if prop.identifier in COPY_SKIP:
+				continue
+			if prop.type == 'COLLECTION':
+				self.collections.append(prop.identifier)
+			elif not prop.is_readonly:
+				length = 0
+				if prop.type in FOREACH_DTYPES and prop.array_length:
+					length = 1
+					for dim in prop.array_dimensions:
+						length *= dim or 1
+				self.writable.append((prop.identifier, prop.type, length))
+		self.writable_names = {name for name, _type, _length in self.writable}
+
+# RNA type identifier : RNASchema
+_rna_schemas = {}
+
+def get_rna_schema(thing) -> RNASchema:
+	bl_rna = thing.bl_rna
+	schema = _rna_schemas.get(bl_rna.identifier)
+	if not schema:
+		schema = _rna_schemas[bl_rna.identifier] = RNASchema(bl_rna)
+	return schema
+
+def copy_attributes(from_thing, to_thing, skip=[""], recursive=False, _visited=None):
 	"""Copy attributes from one thing to another.
 	from_thing: Object to copy values from. (Only if the attribute already exists in to_thing)
 	to_thing: Object to copy attributes into (No new attributes are created, only existing are changed).
 	skip: List of attribute names in from_thing that should not be attempted to be copied.
-	recursive: Copy iterable attributes recursively.
+	recursive: Copy collection attributes recursively. Each struct is only visited once, so self-referencing collections are safe.
 	"""
-	
-	#print("\nCOPYING FROM: " + str(from_thing))
-	#print(".... TO: " + str(to_thing))
-	
-	bad_stuff = skip + ['active', 'bl_rna', 'error_location', 'error_rotation']
-	for prop in dir(from_thing):
-		if "__" in prop: continue
-		if prop in bad_stuff: continue
-
-		if hasattr(to_thing, prop):
-			from_value = getattr(from_thing, prop)
-			# Iterables should be copied recursively, except str.
-			if recursive and type(from_value) != str:
-				# NOTE: I think This will infinite loop if a CollectionProperty contains a reference to itself!
-				warn = False
-				try:
-					# Determine if the property is iterable. Otherwise this throws TypeError.
-					iter(from_value)
-
-					to_value = getattr(to_thing, prop)
-					# The thing we are copying to must therefore be an iterable as well. If this fails though, we should throw a warning.
-					warn = True
-					iter(to_value)
-					count = min(len(to_value), len(from_value))
-					for i in range(0, count):
-						copy_attributes(from_value[i], to_value[i], skip, recursive)
-				except TypeError: # Not iterable.
-					if warn:
-						print("WARNING: Could not copy attributes from iterable to non-iterable field: " + prop + 
-							"\nFrom object: " + str(from_thing) + 
-							"\nTo object: " + str(to_thing)
-						)
-
-			# Copy the attribute.
+	if _visited is None:
+		_visited = set()
+	key = (from_thing.as_pointer(), to_thing.as_pointer())
+	if key in _visited:
+		return
+	_visited.add(key)
+
+	from_schema = get_rna_schema(from_thing)
+	to_schema = get_rna_schema(to_thing)
+	skip = set(skip)
+
+	if recursive:
+		for prop in from_schema.collections:
+			if prop in skip or not hasattr(to_thing, prop):
+				continue
+			copy_collection(getattr(from_thing, prop), getattr(to_thing, prop), skip, _visited)
+
+	for prop, _type, _length in from_schema.writable:
+		if prop in skip or prop not in to_schema.writable_names:
+			continue
+		try:
+			setattr(to_thing, prop, getattr(from_thing, prop))
+		except (AttributeError, TypeError, ValueError) as e:
+			# Some values can't be set depending on context, eg. a target that would create a dependency cycle.
+			print(f"WARNING: Could not copy {prop} from {from_thing} to {to_thing}: {e}")
+
+def copy_collection(from_coll, to_coll, skip, _visited):
+	"""Copy the items of one collection property into the existing items of another.
+	Numeric values are copied for all items at once with foreach_get/foreach_set when the collections match
+	and the collection's owner has an update() method, eg. FCurve.keyframe_points or Mesh.vertices.
+	foreach_set() skips the RNA update callbacks of the items, so the owner's update() is called afterwards.
+	Other collections are copied item by item, which runs the update callbacks.
+	"""
+	import numpy as np
+	count = min(len(from_coll), len(to_coll))
+	if count == 0:
+		return
+
+	item_skip = set(skip)
+	owner_update = getattr(to_coll.data, 'update', None)
+	if (
+		callable(owner_update)
+		and len(from_coll) == len(to_coll)
+		and from_coll[0].bl_rna == to_coll[0].bl_rna
+	):
+		for prop, prop_type, length in get_rna_schema(from_coll[0]).writable:
+			if prop in skip or prop_type not in FOREACH_DTYPES:
+				continue
+			buffer = np.empty(count * max(length, 1), dtype=FOREACH_DTYPES[prop_type])
 			try:
-				setattr(to_thing, prop, from_value)
-				#print(prop + ": " + str(from_value))
-			except AttributeError:	# Read-Only properties throw AttributeError. We ignore silently, which is not great.
+				from_coll.foreach_get(prop, buffer)
+				to_coll.foreach_set(prop, buffer)
+			except (AttributeError, TypeError, RuntimeError):
 				continue
+			item_skip.add(prop)
+		if item_skip != set(skip):
+			owner_update()
+
+	for i in range(count):
+		copy_attributes(from_coll[i], to_coll[i], item_skip, True, _visited)
+
+
+def get_id_datablocks():
+	"""Yield every ID datablock in the file once, including node trees embedded in
+	materials, worlds, lights and scenes, which aren't in any bpy.data collection.
+	"""
+	seen = set()
+	for prop in bpy.data.bl_rna.properties:
+		if prop.type != 'COLLECTION':
+			continue
+		for id in getattr(bpy.data, prop.identifier):
+			if not isinstance(id, bpy.types.ID):
+				break
+			for datablock in (id, getattr(id, 'node_tree', None)):
+				if datablock is None or datablock in seen:
+					continue
+				seen.add(datablock)
+				yield datablock
+
+
+def get_animated_datablocks():
+	"""Yield every ID datablock in the file that has animation data."""
+	for id in get_id_datablocks():
+		if getattr(id, 'animation_data', None):
+			yield id
+
+
+def register():
+	subscribe_bone_renames()
+	subscribe_mode_changes()
+	bpy.app.handlers.load_post.append(subscribe_bone_renames)
+	bpy.app.handlers.load_post.append(subscribe_mode_changes)
+	bpy.app.handlers.load_post.append(invalidate_bone_name_indices)
+	bpy.app.handlers.load_post.append(invalidate_edit_bone_indices)
+
+
+def unregister():
+	bpy.app.handlers.load_post.remove(subscribe_bone_renames)
+	bpy.app.handlers.load_post.remove(subscribe_mode_changes)
+	bpy.app.handlers.load_post.remove(invalidate_bone_name_indices)
+	bpy.app.handlers.load_post.remove(invalidate_edit_bone_indices)
+	bpy.msgbus.clear_by_owner(_msgbus_owner)
+	invalidate_bone_name_indices()
+	invalidate_edit_bone_indices()
@@ -1,6 +1,8 @@
 # Written by ChatGPT.
 
 import bpy
+from bpy.props import EnumProperty
+from time import perf_counter
 
 
 class AddVertexWeightsToActiveOperator(bpy.types.Operator):
@@ -10,6 +12,15 @@ class AddVertexWeightsToActiveOperator(bpy.types.Operator):
     bl_label = "Add Vertex Weights to Active"
     bl_options = {'REGISTER', 'UNDO'}
 
+    normalize: EnumProperty(
+        name="Normalize",
+        items=[
+            ('NONE', "None", "Add the weights together. Blender clamps the result to 1.0"),
+            ('MAX', "Max", "Scale the merged weights so that the highest one is 1.0"),
+        ],
+        default='NONE',
+    )
+
     @classmethod
     def poll(cls, context):
         obj = context.active_object
@@ -40,39 +51,99 @@ class AddVertexWeightsToActiveOperator(bpy.types.Operator):
         return True
 
     def execute(self, context):
+        import numpy as np
+        start_time = perf_counter()
         obj = context.active_object
-        active_bone = context.active_pose_bone
-        active_bone_name = active_bone.name
-        pose_bones = context.selected_pose_bones
-        pose_bones = [bone for bone in pose_bones if bone.name != active_bone_name]
+        active_bone_name = context.active_pose_bone.name
         vertex_groups = obj.vertex_groups
         active_vertex_group = vertex_groups.get(active_bone_name)
+        if not active_vertex_group:
+            active_vertex_group = vertex_groups.new(name=active_bone_name)
+
+        source_groups = [
+            vertex_groups.get(bone.name)
+            for bone in context.selected_pose_bones
+            if bone.name != active_bone_name
+        ]
+        source_groups = [vg for vg in source_groups if vg]
+        if not source_groups:
+            self.report({'WARNING'}, "None of the selected bones have a vertex group.")
+            return {'CANCELLED'}
+
+        merged = merge_vertex_group_weights(
+            obj.data,
+            [vg.index for vg in source_groups],
+            active_vertex_group.index,
+            normalize=self.normalize,
+        )
+        # Vertices with a NaN weight weren't in any of the merged groups.
+        touched = np.flatnonzero(~np.isnan(merged))
+        write_vertex_group_weights(active_vertex_group, touched, merged[touched])
 
-        for bone in pose_bones:
-            vertex_group = vertex_groups.get(bone.name)
-            if not vertex_group:
-                continue
-
-            weights_to_add = {}
-            for vertex in obj.data.vertices:
-                for group in vertex.groups:
-                    if group.group == vertex_group.index:
-                        if vertex.index not in weights_to_add:
-                            weights_to_add[vertex.index] = 0.0
-                        weights_to_add[vertex.index] += group.weight
-
-            for vertex_index, weight in weights_to_add.items():
-                active_vertex_group.add([vertex_index], weight, 'ADD')
-
+        for vertex_group in source_groups:
             vertex_groups.remove(vertex_group)
 
         self.report(
             {'INFO'},
-            "Vertex weights successfully added to the active bone and vertex groups removed.",
+            f"Merged {len(source_groups)} vertex groups over {len(obj.data.vertices)} vertices "
+            f"in {perf_counter() - start_time:.3f}s.",
         )
         return {'FINISHED'}
 
 
+def merge_vertex_group_weights(mesh, source_indices, target_index, normalize='NONE'):
+    """Sum the weights of the source vertex groups onto the target group's weights,
+    reading every group in a single pass over the vertices.
+
+    Returns a float32 array with one weight per vertex, or NaN for vertices that
+    aren't in the target or any of the source groups.
+    """
+    import numpy as np
+    group_indices = set(source_indices)
+    group_indices.add(target_index)
+
+    vert_indices = []
+    weights = []
+    for vertex in mesh.vertices:
+        for group in vertex.groups:
+            if group.group in group_indices:
+                vert_indices.append(vertex.index)
+                weights.append(group.weight)
+
+    merged = np.full(len(mesh.vertices), np.nan, dtype=np.float32)
+    if not vert_indices:
+        return merged
+    vert_indices = np.array(vert_indices, dtype=np.int64)
+    weights = np.array(weights, dtype=np.float32)
+
+    touched = np.unique(vert_indices)
+    merged[touched] = 0.0
+    np.add.at(merged, vert_indices, weights)
+
+    if normalize == 'MAX':
+        highest = merged[touched].max()
+        if highest > 0.0:
+            merged[touched] /= highest
+
+    return merged
+
+
+def write_vertex_group_weights(vertex_group, indices, weights):
+    """Assign weights to the given vertices of a vertex group, with one add() call per distinct weight value.
+    Weights are clamped to the 0-1 range.
+    """
+    import numpy as np
+    indices = np.asarray(indices)
+    if indices.size == 0:
+        return
+    weights = np.clip(np.asarray(weights, dtype=np.float32), 0.0, 1.0)
+    values, inverse = np.unique(weights, return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    splits = np.cumsum(np.bincount(inverse, minlength=len(values)))[:-1]
+    for value, ids in zip(values.tolist(), np.split(indices[order], splits)):
+        vertex_group.add(ids.tolist(), value, 'REPLACE')
+
+
 def menu_func(self, context):
     self.layout.operator(AddVertexWeightsToActiveOperator.bl_idname)
 